@@ -0,0 +1,264 @@
+# coding=utf-8
+"""
+Copyright (C) 2015, marazt. All rights reserved.
+
+Command line streaming pipeline mapping JSON Lines to JSON Lines.
+
+Usage:
+    python -m mapper --registry mymodule:mapper --from A --to B input.jsonl -o output.jsonl --workers 4
+
+The registry is an ObjectMapper instance (or a callable returning one) defined in a user module.
+Every input line is a JSON object whose keys are set as attributes of a new instance of the source class,
+the instance is mapped to the target class and the non-private attributes of the result are written as one
+JSON line. Output keeps the order of the input.
+
+Nested JSON objects (and lists of them) are loaded into instances of the class annotated on the attribute
+of the source class, e.g. 'address: Address', so they are mapped by the registry. Nested objects without
+the annotation stay dictionaries, which are not mapped unless --allow-unmapped is passed.
+"""
+from __future__ import print_function
+
+import argparse
+import importlib
+import json
+import mmap
+import sys
+import time
+from datetime import date, datetime
+from itertools import islice
+from multiprocessing import Pool
+
+from mapper.object_mapper import ObjectMapper, _hint_target_type
+from mapper.object_mapper_exception import ObjectMapperException
+
+try:
+    from typing import get_type_hints
+except ImportError:
+    # type hints are not available, nested JSON objects stay dictionaries
+    get_type_hints = None
+
+BUFFER_SIZE = 1 << 20
+
+# per-process state set by _init_worker
+_state = {}
+
+# source class => {attribute name: class of the nested JSON objects}
+_nested_types = {}
+
+
+def _load(spec, module=None):
+    """
+    Loads an object by its 'module:name' specification.
+    If the module part is missing, the name is looked up in the given module.
+
+    :param spec: object specification
+    :param module: default module
+    :return: The object
+    """
+    module_name, _, name = spec.rpartition(':')
+    if module_name:
+        module = importlib.import_module(module_name)
+    elif module is None:
+        raise ObjectMapperException("{0} must be in a form 'module:name'".format(spec))
+
+    try:
+        return getattr(module, name)
+    except AttributeError:
+        raise ObjectMapperException("{0} not found in {1}".format(name, module.__name__))
+
+
+def _init_worker(registry, type_from, type_to, options):
+    """
+    Resolves the registry and the mapping pair in the current process.
+    """
+    module_name, _, name = registry.rpartition(':')
+    if not module_name:
+        module_name, name = registry, 'mapper'
+    module = importlib.import_module(module_name)
+
+    mapper = _load(name, module)
+    if not isinstance(mapper, ObjectMapper) and callable(mapper):
+        mapper = mapper()
+    if not isinstance(mapper, ObjectMapper):
+        raise ObjectMapperException("{0} is not an ObjectMapper".format(registry))
+
+    _state['mapper'] = mapper
+    _state['type_from'] = _load(type_from, module)
+    _state['type_to'] = _load(type_to, module) if type_to else type(None)
+    _state['options'] = options
+
+
+def _to_json(o):
+    """
+    Converts the value not serializable by json module.
+    """
+    if isinstance(o, (date, datetime)):
+        return o.isoformat()
+    if hasattr(o, '__dict__'):
+        return {k: v for k, v in vars(o).items() if not k.startswith('_')}
+    raise TypeError("{0} is not JSON serializable".format(type(o).__name__))
+
+
+def _nested(cls):
+    """
+    Gets the classes of the nested JSON objects from the type hints of the source class.
+    """
+    nested = _nested_types.get(cls)
+    if nested is None:
+        try:
+            hints = get_type_hints(cls) if get_type_hints is not None else {}
+        except Exception:
+            hints = {}
+        nested = {k: t for k, t in ((k, _hint_target_type(h)) for k, h in hints.items()) if t is not None}
+        _nested_types[cls] = nested
+    return nested
+
+
+def _load_object(cls, data):
+    """
+    Creates the instance of the source class from the decoded JSON object.
+
+    :param cls: source class
+    :param data: decoded JSON object
+    :return: The source instance
+    """
+    obj = cls.__new__(cls)
+    for name, nested_cls in _nested(cls).items():
+        value = data.get(name)
+        if isinstance(value, dict):
+            data[name] = _load_object(nested_cls, value)
+        elif isinstance(value, list):
+            data[name] = [_load_object(nested_cls, v) if isinstance(v, dict) else v for v in value]
+    obj.__dict__.update(data)
+    return obj
+
+
+def _map_chunk(lines):
+    """
+    Maps a chunk of JSON lines.
+
+    :param lines: list of input lines
+    :return: tuple of the mapped JSON lines joined together and the number of records
+    """
+    mapper = _state['mapper']
+    type_from = _state['type_from']
+    type_to = _state['type_to']
+    options = _state['options']
+
+    out = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        from_obj = _load_object(type_from, json.loads(line.decode('utf-8')))
+        to_obj = mapper.map(from_obj, type_to, **options)
+        out.append(json.dumps(_to_json(to_obj), default=_to_json))
+        out.append('\n')
+    return ''.join(out), len(out) // 2
+
+
+def _read_lines(stream, use_mmap):
+    """
+    Reads lines from the binary stream, either buffered or memory-mapped.
+    """
+    if use_mmap:
+        try:
+            data = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be memory-mapped
+            return
+        try:
+            for line in iter(data.readline, b''):
+                yield line
+        finally:
+            data.close()
+    else:
+        for line in stream:
+            yield line
+
+
+def _chunks(lines, chunk_size):
+    """
+    Splits the lines into lists of chunk_size lines.
+    """
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def main(argv=None):
+    """
+    Runs the JSONL mapping pipeline.
+
+    :param argv: command line arguments, sys.argv is used when None
+    :return: exit code
+    """
+    parser = argparse.ArgumentParser(prog='python -m mapper', description="Maps JSON Lines with ObjectMapper.")
+    parser.add_argument('input', nargs='?', default='-', help="input JSONL file, '-' for stdin")
+    parser.add_argument('-o', '--output', default='-', help="output JSONL file, '-' for stdout")
+    parser.add_argument('-r', '--registry', required=True,
+                        help="'module:name' of the ObjectMapper or a callable returning it, name defaults to 'mapper'")
+    parser.add_argument('-f', '--from', dest='type_from', required=True,
+                        help="source class, either a name in the registry module or 'module:name'")
+    parser.add_argument('-t', '--to', dest='type_to', default=None,
+                        help="target class, inferred from the registry if omitted")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="number of worker processes")
+    parser.add_argument('-c', '--chunk-size', type=int, default=1000, help="number of lines per worker task")
+    parser.add_argument('--mmap', action='store_true', help="memory-map the input file")
+    parser.add_argument('--ignore-case', action='store_true', help="ignore attribute case")
+    parser.add_argument('--allow-unmapped', action='store_true', help="copy values without mapping defined")
+    args = parser.parse_args(argv)
+
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error("workers and chunk-size must be positive integers")
+    if args.mmap and args.input == '-':
+        parser.error("--mmap requires an input file")
+
+    options = {'ignore_case': args.ignore_case, 'allow_unmapped': args.allow_unmapped}
+    initargs = (args.registry, args.type_from, args.type_to, options)
+
+    source = getattr(sys.stdin, 'buffer', sys.stdin) if args.input == '-' \
+        else open(args.input, 'rb', buffering=BUFFER_SIZE)
+    target = sys.stdout if args.output == '-' else open(args.output, 'w', buffering=BUFFER_SIZE)
+
+    start = time.time()
+    count = 0
+    pool = None
+    try:
+        # resolving the registry in the main process first reports the errors before any worker starts
+        _init_worker(*initargs)
+        chunks = _chunks(_read_lines(source, args.mmap), args.chunk_size)
+        if args.workers == 1:
+            results = (_map_chunk(chunk) for chunk in chunks)
+        else:
+            pool = Pool(args.workers, _init_worker, initargs)
+            # imap keeps the order of the chunks
+            results = pool.imap(_map_chunk, chunks)
+
+        for text, mapped in results:
+            target.write(text)
+            count += mapped
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if source is not getattr(sys.stdin, 'buffer', sys.stdin):
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+        else:
+            target.flush()
+
+    elapsed = time.time() - start
+    print("Mapped {0} records in {1:.3f}s ({2:.0f} records/s)"
+          .format(count, elapsed, count / elapsed if elapsed else 0), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
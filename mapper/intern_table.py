@@ -0,0 +1,60 @@
+# coding=utf-8
+"""
+Copyright (C) 2015, marazt. All rights reserved.
+"""
+
+
+class InternTable(object):
+    """
+    Bounded table of equal immutable values shared across the mapped objects.
+    The values of the selected target properties and of the selected types are replaced by the first equal value
+    seen. When the table is full, new values are kept as they are.
+    """
+
+    __slots__ = ('fields', 'types', 'max_size', '_table')
+
+    def __init__(self, fields=None, types=None, max_size=10000):
+        """Constructor
+
+        :param fields: names of the target properties whose values are interned
+        :param types: types whose values are interned in all target properties
+        :param max_size: maximal number of distinct values in the table
+        """
+        self.fields = frozenset(fields or ())
+        self.types = frozenset(types or ())
+        self.max_size = max_size
+        # keyed by (type, value), so equal values of different types (1 and True) are not mixed
+        self._table = {}
+
+    def __len__(self):
+        return len(self._table)
+
+    def intern(self, prop, value):
+        """
+        Gets the shared instance of the value if the property or the value type is interned.
+
+        :param prop: target property name
+        :param value: hashable immutable value
+        :return: The shared equal value or the value itself
+        """
+        if prop not in self.fields and value.__class__ not in self.types:
+            return value
+
+        key = (value.__class__, value)
+        shared = self._table.get(key)
+        if shared is not None:
+            return shared
+        if len(self._table) < self.max_size:
+            self._table[key] = value
+        return value
+
+    def clear(self):
+        """
+        Removes all values from the table
+        """
+        self._table.clear()
+
+    def __repr__(self):
+        return '%s(fields=%r, types=%r, size=%d/%d)' % (self.__class__.__name__, sorted(self.fields),
+                                                       [t.__name__ for t in self.types], len(self._table),
+                                                       self.max_size)
@@ -0,0 +1,214 @@
+# coding=utf-8
+"""
+Copyright (C) 2015, marazt. All rights reserved.
+"""
+from datetime import datetime
+from operator import attrgetter
+
+from mapper.object_mapper_exception import ObjectMapperException
+
+
+def _to_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+def _lower(value):
+    return value.lower()
+
+
+def _upper(value):
+    return value.upper()
+
+
+def _strip(value):
+    return value.strip()
+
+
+# built-in converters of the path mapping functions, referenced by name
+converters = {
+    'str': str,
+    'int': int,
+    'float': float,
+    'bool': bool,
+    'date': _to_date,
+    'isoformat': _isoformat,
+    'lower': _lower,
+    'upper': _upper,
+    'strip': _strip,
+}
+
+
+class BatchedFunction(object):
+    """
+    Mapping function computing the property values for a whole batch of source objects at once.
+    """
+
+    __slots__ = ('fnc',)
+
+    def __init__(self, fnc):
+        """Constructor
+
+        :param fnc: function taking a list of source objects and returning a list of values of the same length
+        """
+        if not callable(fnc):
+            raise ObjectMapperException("fnc must be callable")
+        self.fnc = fnc
+
+    def __call__(self, from_obj):
+        """
+        Computes the value for a single source object as a batch of one.
+
+        :param from_obj: source object
+        :return: The value
+        """
+        return self.fnc([from_obj])[0]
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.fnc)
+
+
+def batched(fnc):
+    # type: (Callable[[List[object]], List[object]]) -> BatchedFunction
+    """
+    Marks the mapping function as batched. ObjectMapper.map_batch calls it once for all source objects
+    of the batch, ObjectMapper.map calls it with a batch of one.
+    Can be used as a decorator.
+
+        mapper.create_map(A, B, {'country': batched(lambda objs: lookup_countries([a.country_id for a in objs]))})
+
+    :param fnc: function taking a list of source objects and returning a list of values of the same length
+    :return: The batched mapping function
+    """
+    return BatchedFunction(fnc)
+
+
+class PathFunction(object):
+    """
+    Mapping function reading the value from the source by a dotted attribute path, e.g. 'address.city'.
+    If any attribute on the path is None, the default is returned. The value can be passed through a chain
+    of converters. Unlike lambdas, path functions can be pickled.
+    """
+
+    __slots__ = ('path', 'convert', 'default', '_getter', '_names', '_converters')
+
+    def __init__(self, path, convert=None, default=None):
+        """Constructor
+
+        :param path: dotted attribute path
+        :param convert: converter, or a list of converters applied in order. Converter is either a callable
+                        or a name of the built-in converter (see converters)
+        :param default: value returned if any attribute on the path is None
+        """
+        if not isinstance(path, str) or not all(path.split('.')):
+            raise ObjectMapperException("Invalid attribute path {0}".format(path))
+
+        chain = convert if isinstance(convert, (list, tuple)) else ([convert] if convert is not None else [])
+        resolved = []
+        for c in chain:
+            if not callable(c) and c not in converters:
+                raise ObjectMapperException("Unknown converter {0}".format(c))
+            resolved.append(converters[c] if not callable(c) else c)
+
+        self.path = path
+        self.convert = convert
+        self.default = default
+        # a single attribute is read by the C-level getter, a None can't occur on its path
+        self._getter = attrgetter(path) if '.' not in path else None
+        self._names = tuple(path.split('.'))
+        self._converters = tuple(resolved)
+
+    @property
+    def getter(self):
+        """
+        The attribute getter equal to this function, if there is one, so the mapper can call it directly.
+        That's the case of a single attribute without converters and default.
+
+        :return: The getter or None
+        """
+        if self._getter is not None and not self._converters and self.default is None:
+            return self._getter
+        return None
+
+    def __call__(self, from_obj):
+        """
+        Reads the value from the source object.
+
+        :param from_obj: source object
+        :return: The value
+        """
+        if self._getter is not None:
+            value = self._getter(from_obj)
+        else:
+            # a None on the path makes the value None, a missing attribute is an error
+            value = from_obj
+            for name in self._names:
+                value = getattr(value, name)
+                if value is None:
+                    break
+
+        if value is None:
+            return self.default
+        for c in self._converters:
+            value = c(value)
+        return value
+
+    def __reduce__(self):
+        return self.__class__, (self.path, self.convert, self.default)
+
+    def __repr__(self):
+        return '%s(%r, convert=%r, default=%r)' % (self.__class__.__name__, self.path, self.convert, self.default)
+
+
+class ConstantFunction(object):
+    """
+    Mapping function returning a constant value.
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        """Constructor
+
+        :param value: the constant value
+        """
+        self.value = value
+
+    def __call__(self, from_obj):
+        return self.value
+
+    def __reduce__(self):
+        return self.__class__, (self.value,)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.value)
+
+
+def path(path, convert=None, default=None):
+    # type: (str, Union[str, Callable, List], object) -> PathFunction
+    """
+    Creates the mapping function reading the value by a dotted attribute path, None-safe.
+    A plain string in the create_map mapping dictionary is the same as path(string).
+
+        mapper.create_map(A, B, {'city': 'address.city', 'created': path('created_at', convert=['date', 'isoformat'])})
+
+    :param path: dotted attribute path
+    :param convert: converter or a list of converters, either callables or names of the built-in converters
+    :param default: value returned if any attribute on the path is None
+    :return: The path mapping function
+    """
+    return PathFunction(path, convert, default)
+
+
+def const(value):
+    # type: (object) -> ConstantFunction
+    """
+    Creates the mapping function returning a constant value.
+
+    :param value: the constant value
+    :return: The constant mapping function
+    """
+    return ConstantFunction(value)
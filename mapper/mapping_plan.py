@@ -0,0 +1,183 @@
+# coding=utf-8
+"""
+Copyright (C) 2015, marazt. All rights reserved.
+"""
+from collections import OrderedDict
+from weakref import ref
+
+from mapper.object_mapper_exception import ObjectMapperException
+
+
+_move_to_end = getattr(OrderedDict, 'move_to_end', None)
+
+
+class MappingPlan(object):
+    """
+    Resolved mapping of one source type to one target type.
+    Plans are built once by ObjectMapper for every combination of the mapping options and reused for every object.
+    The plan references its types weakly, so the cached plans don't keep the types alive.
+    """
+
+    __slots__ = ('_key_from', '_key_to', 'fields', 'constants', 'listed', 'profile', 'calls', 'specialized')
+
+    def __init__(self, key_from, key_to, fields, profile=False, constants=(), listed=False):
+        """Constructor
+
+        :param key_from: source type
+        :param key_to: target type
+        :param fields: list of (target property name, mapping function, nested target type, nested field mask) tuples,
+                       the mapping function is None if the value is read from the source attribute of the same name,
+                       the nested target type is None if it is inferred from the mappings of the source value,
+                       the nested field mask is None if all fields of the nested object are mapped
+        :param profile: if set to true, the types of the source values are recorded for the specialization
+        :param constants: list of (target property name, value) tuples of the constant mapping functions,
+                          the values are set without calling the functions
+        :param listed: if set to true, only the source attributes listed by dir() are read, as the source type
+                       defines its attributes dynamically
+        """
+        self._key_from = ref(key_from)
+        self._key_to = ref(key_to)
+        self.fields = fields
+        self.constants = constants
+        self.listed = listed
+        # observed type of every source property (None if more types are observed) and the number of mappings
+        self.profile = {} if profile else None
+        self.calls = 0
+        # fields specialized for the observed types, see ObjectMapper._specialize
+        self.specialized = None
+
+    @property
+    def key_from(self):
+        """
+        The source type, None if it was garbage collected
+        """
+        return self._key_from()
+
+    @property
+    def key_to(self):
+        """
+        The target type, None if it was garbage collected
+        """
+        return self._key_to()
+
+    def __repr__(self):
+        return '%s(%s -> %s, %r)' % (self.__class__.__name__, self.key_from.__name__, self.key_to.__name__,
+                                     [field[0] for field in self.fields] + [prop for prop, _ in self.constants])
+
+
+class PlanCache(object):
+    """
+    Cache of the mapping plans. If max_size is set, the least recently used plan is evicted when it's exceeded.
+    """
+
+    __slots__ = ('max_size', '_data')
+
+    def __init__(self, max_size=None):
+        """Constructor
+
+        :param max_size: maximal number of cached plans, None for unbounded cache
+        """
+        if max_size is not None and (not isinstance(max_size, int) or max_size < 1):
+            raise ObjectMapperException("max_size must be a positive integer")
+        self.max_size = max_size
+        self._data = OrderedDict() if max_size is not None else {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        """
+        Gets the cached value.
+
+        :param key: The key
+        :return: The value or None if the key is not cached
+        """
+        value = self._data.get(key)
+        if value is not None and self.max_size is not None:
+            if _move_to_end is not None:
+                _move_to_end(self._data, key)
+            else:
+                # OrderedDict.move_to_end is not available on python 2.7
+                self._data[key] = self._data.pop(key)
+        return value
+
+    def put(self, key, value):
+        """
+        Caches the value, evicting the least recently used one if the cache is full.
+
+        :param key: The key
+        :param value: The value
+        """
+        self._data[key] = value
+        if self.max_size is not None and len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes all cached values
+        """
+        self._data.clear()
+
+    def remove(self, predicate):
+        """
+        Removes the cached values matching the predicate.
+
+        :param predicate: function of the key and the value, returning True if the value must be removed
+        """
+        for key in [key for key, value in self._data.items() if predicate(key, value)]:
+            del self._data[key]
+
+
+class WeakPlanCache(PlanCache):
+    """
+    Cache of the mapping plans keyed by (source type, target type, ...) tuples, which references the types weakly.
+    The plans of a type are removed when the type is garbage collected.
+    """
+
+    __slots__ = ('_watched', '__weakref__')
+
+    def __init__(self, max_size=None):
+        """Constructor
+
+        :param max_size: maximal number of cached plans, None for unbounded cache
+        """
+        PlanCache.__init__(self, max_size)
+        # weak references with the callback removing the plans of the collected types
+        self._watched = set()
+
+    def get(self, key):
+        """
+        Gets the cached value.
+
+        :param key: The key
+        :return: The value or None if the key is not cached
+        """
+        return PlanCache.get(self, (ref(key[0]), ref(key[1])) + key[2:])
+
+    def put(self, key, value):
+        """
+        Caches the value, evicting the least recently used one if the cache is full.
+
+        :param key: The key
+        :param value: The value, it must not reference the types of the key
+        """
+        self_ref = ref(self)
+
+        def remove(type_ref):
+            cache = self_ref()
+            if cache is not None:
+                cache._watched.discard(type_ref)
+                PlanCache.remove(cache, lambda k, v: k[0]() is None or k[1]() is None)
+
+        for t in key[:2]:
+            # the weak references compare by their types, so every type is watched once
+            self._watched.add(ref(t, remove))
+        PlanCache.put(self, (ref(key[0]), ref(key[1])) + key[2:], value)
+
+    def remove(self, predicate):
+        """
+        Removes the cached values matching the predicate.
+
+        :param predicate: function of the key and the value, returning True if the value must be removed
+        """
+        PlanCache.remove(self, lambda k, v: predicate((k[0](), k[1]()) + k[2:], v))
@@ -4,10 +4,58 @@ Copyright (C) 2015, marazt. All rights reserved.
 """
 from inspect import getmembers, isroutine
 from datetime import date, datetime
+from weakref import WeakKeyDictionary, ref
 
 from mapper.casedict import CaseDict
+from mapper.intern_table import InternTable
+from mapper.mapping_functions import BatchedFunction, ConstantFunction, PathFunction
+from mapper.mapping_plan import MappingPlan, PlanCache, WeakPlanCache
+from mapper.weakpairdict import WeakPairDict
 from mapper.object_mapper_exception import ObjectMapperException
 
+try:
+    from typing import List, Union, get_type_hints
+except ImportError:
+    # type hints are not available, nested target types are always inferred
+    get_type_hints = None
+
+try:
+    from types import UnionType
+except ImportError:
+    UnionType = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+_missing = object()
+
+
+def _hint_target_type(hint):
+    # type: (object) -> Optional[type]
+    """
+    Gets the nested target type from the type hint of the target property.
+    Supports the class itself, List[class], Optional[class] and their combinations.
+
+    :param hint: the type hint
+    :return: The target type or None if the hint doesn't define one
+    """
+    origin = getattr(hint, '__origin__', None)
+    args = getattr(hint, '__args__', None) or ()
+    if UnionType is not None and isinstance(hint, UnionType):
+        origin = Union
+
+    if origin is Union:
+        args = [a for a in args if a is not type(None)]
+        return _hint_target_type(args[0]) if len(args) == 1 else None
+    elif origin is list or origin is List:
+        return _hint_target_type(args[0]) if len(args) == 1 else None
+    elif isinstance(hint, type) and hint not in ObjectMapper.primitive_types:
+        return hint
+    else:
+        return None
+
 
 class ObjectMapper(object):
     """
@@ -15,13 +63,27 @@ class ObjectMapper(object):
     Supports mapping conversions too
     """
 
-    primitive_types = { int, str, bool, date, datetime }
+    primitive_types = { int, float, str, bool, date, datetime }
 
-    def __init__(self):
+    def __init__(self, track_memory=False, weak_registry=False, plan_cache_size=None, specialize_after=None):
         """Constructor
 
         Args:
           mappings: dictionary of the attribute conversions
+          weak_registry: if set to true, the mappings reference the types weakly, so the mappings of the types
+                         which are not used elsewhere (e.g. generated at runtime) are removed with the types
+          plan_cache_size: maximal number of cached mapping plans and field masks, the least recently used ones
+                           are evicted. The cache is unbounded by default, with weak_registry it defaults to 256
+                           and the plans of the collected types are removed with them.
+          specialize_after: if set, the types of the source values are recorded for every mapping plan and
+                            after this number of mappings the plan is specialized for the observed types
+                            with a single type check per property. The plan falls back to the generic mapping
+                            when the check fails. Counters are in specialization_stats. Plans are not specialized
+                            with weak_registry, as the recorded types would be kept alive by the plans.
+          track_memory: if set to true, bytes allocated and peak memory of every top-level mapping
+                        are measured with tracemalloc and accumulated in memory_stats per mapping pair.
+                        If tracemalloc is not tracing yet, it's started for every map or map_batch call
+                        and stopped when the call returns.
 
         Examples:
 
@@ -84,10 +146,39 @@ class ObjectMapper(object):
         """
 
         # mapping is a 2-layer dict keyed by source type then by dest type, and stores two things in a tuple:
-        #  - the destination type class
+        #  - the destination type class (weak reference with weak_registry)
         #  - custom mapping functions, if any
-        self.mappings = {}
-        pass
+        self.weak_registry = weak_registry
+        self.mappings = WeakKeyDictionary() if weak_registry else {}
+
+        if weak_registry and plan_cache_size is None:
+            plan_cache_size = 256
+
+        # mapping plans keyed by the mapping pair and the mapping options
+        self._plans = WeakPlanCache(plan_cache_size) if weak_registry else PlanCache(plan_cache_size)
+        # compiled field masks keyed by the field paths
+        self._masks = PlanCache(plan_cache_size)
+
+        if track_memory and tracemalloc is None:
+            raise ObjectMapperException("track_memory requires the tracemalloc module")
+
+        # memory_stats is keyed by the mapping pair (source type, dest type) and stores a dict with:
+        #  - count: number of mapped objects
+        #  - allocated: total bytes allocated and still held after the mapping, including the mapped objects
+        #  - peak: maximal peak of the allocated bytes during one mapping, or the allocated bytes
+        #          if tracemalloc was started by someone else and its peak can't be reset
+        # with weak_registry, the stats are removed together with the types
+        self.track_memory = track_memory
+        self.memory_stats = WeakPairDict() if weak_registry else {}
+        self._tracking = False
+        self._owns_tracing = False
+
+        if specialize_after is not None and (not isinstance(specialize_after, int) or specialize_after < 1):
+            raise ObjectMapperException("specialize_after must be a positive integer")
+
+        # specialization_stats counts the plans specialized for the observed types and the fallbacks (deopts)
+        self.specialize_after = specialize_after
+        self.specialization_stats = {'specializations': 0, 'deopts': 0}
 
     def create_map(self, type_from, type_to, mapping=None):
         # type: (type, type, Dict) -> None
@@ -96,7 +187,9 @@ class ObjectMapper(object):
         :param type_from: source type
         :param type_to: target type
         :param mapping: dictionary of mapping definitions in a form {'target_property_name',
-                        lambda function from rhe source}
+                        lambda function from rhe source}, the function can be batched
+                        (see mapper.mapping_functions.batched) or declarative: a dotted path string
+                        (e.g. 'address.city'), path(...) or const(...) from mapper.mapping_functions
 
         :return: None
         """
@@ -110,8 +203,13 @@ class ObjectMapper(object):
         if (mapping is not None and not isinstance(mapping, dict)):
             raise ObjectMapperException("mapping, if provided, must be a Dict type")
 
+        if mapping is not None:
+            # dotted paths are compiled to the attribute getters
+            mapping = {k: PathFunction(v) if isinstance(v, str) else v for k, v in mapping.items()}
+
         key_from = type_from
         key_to = type_to
+        value = (ref(type_to) if self.weak_registry else type_to, mapping)
 
         if key_from in self.mappings:
             inner_map = self.mappings[key_from]
@@ -120,14 +218,51 @@ class ObjectMapper(object):
                     "Mapping for {0}.{1} -> {2}.{3} already exists".format(key_from.__module__, key_from.__name__,
                                                                    key_to.__module__, key_to.__name__))
             else:
-                inner_map[key_to] = (type_to, mapping)
+                inner_map[key_to] = value
         else:
-            self.mappings[key_from] = {}
-            self.mappings[key_from][key_to] = (type_to, mapping)
+            self.mappings[key_from] = WeakKeyDictionary() if self.weak_registry else {}
+            self.mappings[key_from][key_to] = value
+
+        self._invalidate_plans(key_from)
+
+    def remove_map(self, type_from, type_to):
+        # type: (type, type) -> None
+        """Method for removing mapping definitions
+
+        :param type_from: source type
+        :param type_to: target type
+
+        :return: None
+        """
+        if type_from not in self.mappings or type_to not in self.mappings[type_from]:
+            raise ObjectMapperException("No mapping defined for {0}.{1} -> {2}.{3}"
+                .format(type_from.__module__, type_from.__name__, type_to.__module__, type_to.__name__))
+
+        inner_map = self.mappings[type_from]
+        del inner_map[type_to]
+        if not inner_map:
+            del self.mappings[type_from]
+
+        self._invalidate_plans(type_from)
+        self.memory_stats.pop((type_from, type_to), None)
 
+    def _invalidate_plans(self, type_from):
+        # type: (type) -> None
+        """Method for removing the cached plans depending on the mappings of the source type
+
+        These are the plans of the source type and the specialized plans whose nested properties
+        were resolved by its mappings. Plans of the other types are kept.
+        """
+        def depends(key, plan):
+            if key[0] is type_from:
+                return True
+            return plan.specialized is not None and any(guard is type_from or nested_to is type_from
+                                                        for _, _, guard, nested_to, _, _ in plan.specialized)
 
-    def map(self, from_obj, to_type=type(None), ignore_case=False, allow_none=False, excluded=None, included=None, allow_unmapped=False):
-        # type: (object, type, bool, bool, List[str], List[str], bool) -> object
+        self._plans.remove(depends)
+
+    def map(self, from_obj, to_type=type(None), ignore_case=False, allow_none=False, excluded=None, included=None, allow_unmapped=False, fields=None):
+        # type: (object, type, bool, bool, List[str], List[str], bool, List[str]) -> object
         """Method for creating target object instance
 
         :param from_obj: source object to be mapped from
@@ -137,6 +272,8 @@ class ObjectMapper(object):
         :param excluded: A list of fields to exclude when performing the mapping
         :param included: A list of fields to force inclusion when performing the mapping
         :param allow_unmapped: if set to true, copy over the non-primitive object that didn't have a mapping defined; otherwise exception
+        :param fields: A list of field paths to map, e.g. ['name', 'address.city', 'orders[].total'], the other fields
+                       and nested objects are not read nor mapped
 
         :return: Instance of the target class with mapped attributes
         """
@@ -147,8 +284,187 @@ class ObjectMapper(object):
             from_obj.__dict__
 
         key_from = from_obj.__class__
+        key_to = self._resolve_to_type(key_from, to_type)
+
+        started = self._start_tracing()
+        try:
+            return self._map_resolved(from_obj, key_from, key_to, ignore_case, allow_none, excluded, included,
+                                      allow_unmapped, None, None, self._compile_fields(fields))
+        finally:
+            if started:
+                self._stop_tracing()
+
+    def map_batch(self, from_objs, to_type=type(None), ignore_case=False, allow_none=False, excluded=None, included=None, allow_unmapped=False, intern=None, fields=None):
+        # type: (Iterable[object], type, bool, bool, List[str], List[str], bool, Union[List, InternTable], List[str]) -> List[object]
+        """Method for creating target object instances for a batch of source objects
+
+        The target type is resolved once per source class of the batch instead of once per object
+        and the batched mapping functions (see mapper.mapping_functions.batched) are called once
+        with all source objects of the batch, including the nested ones.
 
-        if key_from not in self.mappings:
+        :param from_objs: source objects to be mapped from
+        :param to_type: target type
+        :param ignore_case: if set to true, ignores attribute case when performing the mapping
+        :param allow_none: if set to true, maps None source objects to None; otherwise throws an exception
+        :param excluded: A list of fields to exclude when performing the mapping
+        :param included: A list of fields to force inclusion when performing the mapping
+        :param allow_unmapped: if set to true, copy over the non-primitive object that didn't have a mapping defined; otherwise exception
+        :param intern: A list of target property names and primitive types whose equal values are shared across
+                       the batch (list elements are not interned), or an InternTable to share them across batches
+        :param fields: A list of field paths to map, e.g. ['name', 'address.city', 'orders[].total'], the other fields
+                       and nested objects are not read nor mapped
+
+        :return: List of instances of the target class with mapped attributes
+        """
+        intern_table = self._create_intern_table(intern)
+        mask = self._compile_fields(fields)
+
+        resolved = {}
+        items = []
+        for from_obj in from_objs:
+            if (from_obj is None) and allow_none:
+                items.append((None, None))
+                continue
+            else:
+                from_obj.__dict__
+
+            key_from = from_obj.__class__
+            pair = resolved.get(key_from)
+            if pair is None:
+                key_to = self._resolve_to_type(key_from, to_type)
+                pair = resolved[key_from] = (key_from, key_to,
+                                             self._get_plan(key_from, key_to, ignore_case, excluded, included, mask))
+            items.append((from_obj, pair))
+
+        # batched mapping functions of all nesting levels are collected and called once per batch
+        pending = []
+        # with the memory tracking, the top-level mapping pair of every collected function call
+        pairs = [] if self.track_memory else None
+        started = self._start_tracing()
+        try:
+            result = []
+            for from_obj, pair in items:
+                if pair is None:
+                    result.append(None)
+                    continue
+                key_from, key_to, plan = pair
+                result.append(self._map_resolved(from_obj, key_from, key_to, ignore_case, allow_none,
+                                                 excluded, included, allow_unmapped, pending, intern_table, mask, plan))
+                if pairs is not None:
+                    pairs.extend([(key_from, key_to)] * (len(pending) - len(pairs)))
+            self._resolve_pending(pending, intern_table, pairs)
+        finally:
+            if started:
+                self._stop_tracing()
+        return result
+
+    def _resolve_pending(self, pending, intern_table, pairs=None):
+        # type: (List[Tuple], InternTable, List[Tuple]) -> None
+        """Method for calling the batched mapping functions collected while mapping the batch
+
+        :param pending: list of (target object, target property name, batched function, source object) tuples
+        :param intern_table: table of the shared primitive values, if any
+        :param pairs: list of the top-level mapping pairs of the pending items if the memory is tracked,
+                      the allocations of every call are accounted to them in proportion to the number of items
+        """
+        groups = {}
+        for index, item in enumerate(pending):
+            inst, prop, fnc, from_obj = item
+            groups.setdefault((fnc, inst.__class__, prop), []).append(index)
+
+        for (fnc, key_to, prop), indexes in groups.items():
+            group = [pending[i] for i in indexes]
+            if pairs is not None:
+                self._tracking = True
+                before = tracemalloc.get_traced_memory()[0]
+
+            try:
+                values = self._call_batched(fnc, [from_obj for inst, prop, fnc, from_obj in group], key_to, prop)
+                for (inst, prop, fnc, from_obj), val in zip(group, values):
+                    if intern_table is not None and val.__class__ in ObjectMapper.primitive_types:
+                        val = intern_table.intern(prop, val)
+                    setattr(inst, prop, val)
+            finally:
+                if pairs is not None:
+                    self._tracking = False
+
+            if pairs is not None:
+                allocated = tracemalloc.get_traced_memory()[0] - before
+                counts = {}
+                for i in indexes:
+                    counts[pairs[i]] = counts.get(pairs[i], 0) + 1
+                for pair, count in counts.items():
+                    self.memory_stats[pair]['allocated'] += allocated * count // len(indexes)
+
+    @staticmethod
+    def _create_intern_table(intern):
+        # type: (Union[List, InternTable]) -> Optional[InternTable]
+        """Method for creating the intern table from the list of property names and types"""
+        if intern is None or isinstance(intern, InternTable):
+            return intern
+
+        fields = [i for i in intern if not isinstance(i, type)]
+        types = [i for i in intern if isinstance(i, type)]
+        if not all(isinstance(f, str) for f in fields):
+            raise ObjectMapperException("intern must contain property names and types only")
+        if not all(t in ObjectMapper.primitive_types for t in types):
+            raise ObjectMapperException("only primitive types can be interned")
+        return InternTable(fields, types)
+
+    @staticmethod
+    def _call_batched(fnc, from_objs, key_to, prop):
+        # type: (BatchedFunction, List[object], type, str) -> List[object]
+        """Method for calling the batched mapping function and checking its result"""
+        try:
+            values = list(fnc.fnc(from_objs))
+        except Exception:
+            raise ObjectMapperException("Invalid mapping function while setting property {0}.{1}".
+                                        format(key_to.__name__, prop))
+
+        if len(values) != len(from_objs):
+            raise ObjectMapperException("Batched mapping function returned {0} values for {1} objects "
+                                        "while setting property {2}.{3}".format(len(values), len(from_objs),
+                                                                                key_to.__name__, prop))
+        return values
+
+    def amap_stream(self, async_iterable, to_type=type(None), batch_size=100, max_in_flight=1000, **kwargs):
+        # type: (AsyncIterable[object], type, int, int, **Any) -> AsyncIterator[object]
+        """Method for mapping objects of an async iterable
+
+        Source objects are consumed by a background task into a queue bounded by max_in_flight,
+        so a fast producer is suspended until the consumer catches up. Objects available in the queue
+        are mapped together in batches of up to batch_size with map_batch().
+
+        :param async_iterable: async iterable of the source objects
+        :param to_type: target type
+        :param batch_size: maximal number of source objects mapped at once
+        :param max_in_flight: maximal number of source objects buffered ahead of the consumer
+        :param kwargs: other arguments of the map_batch method
+
+        :return: Async iterator of instances of the target class with mapped attributes
+        """
+        # imported lazily, the async syntax is not available on all supported Python versions
+        from mapper.object_mapper_async import amap_stream
+
+        if (not isinstance(batch_size, int) or batch_size < 1):
+            raise ObjectMapperException("batch_size must be a positive integer")
+
+        if (not isinstance(max_in_flight, int) or max_in_flight < 1):
+            raise ObjectMapperException("max_in_flight must be a positive integer")
+
+        return amap_stream(self, async_iterable, to_type, batch_size, max_in_flight, kwargs)
+
+    def _resolve_to_type(self, key_from, to_type):
+        # type: (type, type) -> type
+        """Method for resolving the target type of the mapping
+
+        :param key_from: source type
+        :param to_type: requested target type, type(None) to infer it from the mappings
+
+        :return: The target type
+        """
+        # with weak_registry, all target types of the source type may be already collected
+        if key_from not in self.mappings or not self.mappings[key_from]:
             raise ObjectMapperException("No mapping defined for {0}.{1}"
                 .format(key_from.__module__, key_from.__name__))
 
@@ -165,11 +481,26 @@ class ObjectMapper(object):
                 raise ObjectMapperException("No mapping defined for {0}.{1} -> {2}.{3}"
                 .format(key_from.__module__, key_from.__name__, to_type.__module__, to_type.__name__))
             key_to = to_type
+        return key_to
+
+    def _get_plan(self, key_from, key_to, ignore_case, excluded, included, mask=None):
+        # type: (type, type, bool, List[str], List[str], Tuple) -> MappingPlan
+        """Method for getting the cached mapping plan of the mapping pair, the plan is built on the first use
+
+        Only the target properties which are not excluded, private, suppressed or pruned by the field mask
+        are kept in the plan, so the source attributes of the other properties are never read.
+
+        :param mask: compiled field mask of this nesting level (see _compile_fields), None for all fields
+
+        :return: The mapping plan
+        """
+        plan_key = (key_from, key_to, ignore_case,
+                    tuple(excluded) if excluded else None, tuple(included) if included else None, mask)
+        plan = self._plans.get(plan_key)
+        if plan is not None:
+            return plan
+
         custom_mappings = self.mappings[key_from][key_to][1]
-        
-        # Currently, all target class data members need to have default value
-        # Object with __init__ that carries required non-default arguments are not supported
-        inst = key_to()
 
         def not_private(s):
             return not s.startswith('_')
@@ -180,67 +511,436 @@ class ObjectMapper(object):
         def is_included(s, mapping):
             return (included and s in included) or (mapping and s in mapping)
 
-        from_obj_attributes = getmembers(from_obj, lambda a: not isroutine(a))
-        from_obj_dict = {k: v for k, v in from_obj_attributes}
+        # Currently, all target class data members need to have default value
+        # Object with __init__ that carries required non-default arguments are not supported
+        to_obj_attributes = getmembers(key_to(), lambda a: not isroutine(a))
+        to_obj_dict = {k: k for k, v in to_obj_attributes if not_excluded(k) and (not_private(k) or is_included(k, custom_mappings))}
+        to_props = CaseDict(to_obj_dict) if ignore_case else to_obj_dict
 
-        to_obj_attributes = getmembers(inst, lambda a: not isroutine(a))
-        to_obj_dict = {k: v for k, v in to_obj_attributes if not_excluded(k) and (not_private(k) or is_included(k, custom_mappings))}
+        try:
+            hints = get_type_hints(key_to) if get_type_hints is not None else {}
+        except Exception:
+            # unresolvable forward references, the nested target types are inferred
+            hints = {}
 
-        if ignore_case:
-            from_props = CaseDict(from_obj_dict)
-            to_props = CaseDict(to_obj_dict)
-        else:
-            from_props = from_obj_dict
-            to_props = to_obj_dict
-
-        def map_obj(o, allow_unmapped):
-            if o is not None:
-                key_from_child = o.__class__
-                if (key_from_child in self.mappings):
-                    # if key_to has a mapping defined, nests the map() call
-                    return self.map(o, type(None), ignore_case, allow_none, excluded, included, allow_unmapped)
-                elif (key_from_child in ObjectMapper.primitive_types):
-                    # allow primitive types without mapping
-                    return o
-                else:
-                    # fail complex type conversion if mapping was not defined, unless explicitly allowed
-                    if allow_unmapped:
-                        return o
-                    else:
-                        raise ObjectMapperException("No mapping defined for {0}.{1}"
-                            .format(key_from_child.__module__, key_from_child.__name__))
-            else:
-                return None
+        if mask is not None:
+            child_masks = CaseDict(mask) if ignore_case else dict(mask)
 
+        fields = []
+        constants = []
         for prop in to_props:
-            
-            val = None
-            suppress_mapping = False
+            child_mask = None
+            if mask is not None:
+                if prop not in child_masks:
+                    continue
+                child_mask = child_masks[prop]
 
             # mapping function take precedence over complex type mapping
             if custom_mappings is not None and prop in custom_mappings:
-                try:
-                    fnc = custom_mappings[prop]
-                    if fnc is not None:
-                        val = fnc(from_obj)
+                fnc = custom_mappings[prop]
+                if fnc is not None:
+                    if child_mask is not None:
+                        raise ObjectMapperException("Nested fields can't be selected on the custom mapped property "
+                                                    "{0}.{1}".format(key_to.__name__, prop))
+                    if fnc.__class__ is ConstantFunction:
+                        constants.append((prop, fnc.value))
                     else:
-                        suppress_mapping = True
+                        # plain attribute paths are read by the C-level getter directly
+                        getter = fnc.getter if fnc.__class__ is PathFunction else None
+                        fields.append((prop, getter if getter is not None else fnc, None, None))
+            else:
+                # the annotated type binds the nested mapping to a concrete target type
+                child_type = _hint_target_type(hints[prop]) if prop in hints else None
+                if child_type is not None and self.weak_registry:
+                    child_type = ref(child_type)
+                fields.append((prop, None, child_type, child_mask))
+
+        # the attributes of the sources customizing the attribute access are mapped only if dir() lists them
+        listed = (getattr(key_from, '__getattr__', None) is not None or key_from.__dir__ is not object.__dir__
+                  or key_from.__getattribute__ is not object.__getattribute__)
+
+        # types of the case insensitive or listed properties depend on the source names, so such plans are not specialized,
+        # neither are the plans of the weak registry, which would keep the recorded types alive
+        profile = self.specialize_after is not None and not ignore_case and not listed and not self.weak_registry
+        plan = MappingPlan(key_from, key_to, fields, profile, constants, listed)
+        self._plans.put(plan_key, plan)
+        return plan
+
+    def _compile_fields(self, fields):
+        # type: (List[str]) -> Optional[Tuple]
+        """Method for compiling the field paths into the cached field mask
+
+        The mask is a tuple of (property name, nested mask) pairs, where the nested mask is None
+        if the whole property is requested. 'orders[].total' and 'orders.total' are equal,
+        the mask of a list property applies to its items.
+
+        :param fields: list of field paths, e.g. ['name', 'address.city', 'orders[].total']
+
+        :return: The field mask or None if all fields are requested
+        """
+        if fields is None:
+            return None
+
+        # a string would be iterated by characters, so the paths are checked before the cache lookup
+        if not isinstance(fields, (list, tuple)) or not all(isinstance(path, str) for path in fields):
+            raise ObjectMapperException("fields must be a list of field paths")
+
+        fields_key = tuple(fields)
+        mask = self._masks.get(fields_key)
+        if mask is not None:
+            return mask
+
+        tree = {}
+        for path in fields:
+            names = path.replace('[]', '').split('.')
+            if not all(names):
+                raise ObjectMapperException("Invalid field path {0}".format(path))
+
+            node = tree
+            for name in names[:-1]:
+                child = node.get(name, {})
+                if child is None:
+                    # the whole property is already requested
+                    break
+                node = node.setdefault(name, child)
+            else:
+                node[names[-1]] = None
+
+        def freeze(node):
+            return tuple(sorted((name, freeze(child) if child is not None else None) for name, child in node.items()))
+
+        mask = freeze(tree)
+        self._masks.put(fields_key, mask)
+        return mask
+
+    def _map_resolved(self, from_obj, key_from, key_to, ignore_case, allow_none, excluded, included, allow_unmapped,
+                      pending=None, intern_table=None, mask=None, plan=None):
+        # type: (object, type, type, bool, bool, List[str], List[str], bool, List, InternTable, Tuple, MappingPlan) -> object
+        """Method for creating target object instance of the already resolved mapping pair
+
+        :param pending: list collecting the batched mapping functions called later by map_batch, if any
+        :param intern_table: table of the shared primitive values, if any
+        :param mask: compiled field mask of this nesting level, if any
+        :param plan: the mapping plan of the pair and the options if already resolved (map_batch), None to get it
+        """
+        if self.track_memory and not self._tracking:
+            return self._map_tracked(from_obj, key_from, key_to, ignore_case, allow_none, excluded, included,
+                                     allow_unmapped, pending, intern_table, mask, plan)
+
+        if plan is None:
+            plan = self._get_plan(key_from, key_to, ignore_case, excluded, included, mask)
+        if plan.specialized is not None:
+            return self._map_specialized(from_obj, key_to, plan, allow_none, excluded, included, allow_unmapped,
+                                         pending, intern_table)
+
+        inst = key_to()
+        profile = plan.profile
+
+        if ignore_case:
+            # only the names are listed, the source attributes are read on demand
+            from_names = {k.lower(): k for k in dir(from_obj)}
+        elif plan.listed:
+            from_names = {k: k for k in dir(from_obj)}
+        else:
+            from_names = None
+
+        for prop, fnc, child_type, child_mask in plan.fields:
+            if fnc is not None:
+                if pending is not None and fnc.__class__ is BatchedFunction:
+                    # called once for the whole batch by map_batch
+                    pending.append((inst, prop, fnc, from_obj))
+                    continue
+                try:
+                    val = fnc(from_obj)
                 except Exception:
                     raise ObjectMapperException("Invalid mapping function while setting property {0}.{1}".
                                                 format(inst.__class__.__name__, prop))
-
-            elif prop in from_props:
+            else:
                 # try find property with the same name in the source
-                from_obj_child = from_props[prop]
+                name = prop if from_names is None else from_names.get(prop.lower() if ignore_case else prop)
+                from_obj_child = getattr(from_obj, name, _missing) if name is not None else _missing
+
+                if profile is not None:
+                    # records the type of the property, None if more types are observed
+                    observed = profile.get(prop, _missing)
+                    if observed is not from_obj_child.__class__:
+                        profile[prop] = from_obj_child.__class__ if observed is _missing else None
+
+                if from_obj_child is _missing or isroutine(from_obj_child):
+                    continue
+
                 if isinstance(from_obj_child, list):
-                    val = [map_obj(from_obj_child_i, allow_unmapped) for from_obj_child_i in from_obj_child]
+                    val = [self._map_value(from_obj_child_i, child_type, ignore_case, allow_none, excluded,
+                                           included, allow_unmapped, pending, intern_table, child_mask)
+                           for from_obj_child_i in from_obj_child]
                 else:
-                    val = map_obj(from_obj_child, allow_unmapped)
-            
+                    val = self._map_value(from_obj_child, child_type, ignore_case, allow_none, excluded, included,
+                                          allow_unmapped, pending, intern_table, child_mask)
+
+            if intern_table is not None and val.__class__ in ObjectMapper.primitive_types:
+                val = intern_table.intern(prop, val)
+
+            setattr(inst, prop, val)
+
+        for prop, val in plan.constants:
+            setattr(inst, prop, val)
+
+        if profile is not None:
+            plan.calls += 1
+            if plan.calls >= self.specialize_after:
+                self._specialize(plan)
+
+        return inst
+
+    def _specialize(self, plan):
+        # type: (MappingPlan) -> None
+        """Method for specializing the plan for the types observed during the warm-up
+
+        Every property which always had the same primitive type (or None) is copied after a single type check,
+        every property which always had the same mapped type is mapped to the already resolved target type.
+        Other properties are mapped generically.
+        """
+        specialized = []
+        guarded = False
+        for prop, fnc, child_type, child_mask in plan.fields:
+            guard = nested_to = None
+            observed = plan.profile.get(prop)
+            if fnc is None and observed is not None:
+                if observed in ObjectMapper.primitive_types or observed is type(None):
+                    guard = observed
+                elif observed in self.mappings:
+                    inner_map = self.mappings[observed]
+                    if child_type is None:
+                        try:
+                            nested_to = self._resolve_to_type(observed, None)
+                            guard = observed
+                        except ObjectMapperException:
+                            nested_to = None
+                    elif child_type in inner_map:
+                        nested_to = child_type
+                        guard = observed
+            guarded = guarded or guard is not None
+            specialized.append((prop, fnc, guard, nested_to, child_type, child_mask))
+
+        plan.profile = None
+        if guarded:
+            plan.specialized = specialized
+            self.specialization_stats['specializations'] += 1
+
+    def _deoptimize(self, plan):
+        # type: (MappingPlan) -> None
+        """Method for falling back to the generic mapping when the type check of the specialized plan fails
+
+        The types are recorded again, so the plan can be specialized for the new types later.
+        """
+        if plan.specialized is not None:
+            plan.specialized = None
+            plan.profile = {}
+            plan.calls = 0
+            self.specialization_stats['deopts'] += 1
+
+    def _map_specialized(self, from_obj, key_to, plan, allow_none, excluded, included, allow_unmapped, pending,
+                         intern_table):
+        # type: (object, type, MappingPlan, bool, List[str], List[str], bool, List, InternTable) -> object
+        """Method for creating target object instance by the specialized plan, see _specialize"""
+        inst = key_to()
+
+        for prop, fnc, guard, nested_to, child_type, child_mask in plan.specialized:
+            if fnc is not None:
+                if pending is not None and fnc.__class__ is BatchedFunction:
+                    # called once for the whole batch by map_batch
+                    pending.append((inst, prop, fnc, from_obj))
+                    continue
+                try:
+                    val = fnc(from_obj)
+                except Exception:
+                    raise ObjectMapperException("Invalid mapping function while setting property {0}.{1}".
+                                                format(inst.__class__.__name__, prop))
             else:
-                suppress_mapping = True
+                val = getattr(from_obj, prop, _missing)
+                if val.__class__ is guard:
+                    if nested_to is not None:
+                        val = self._map_resolved(val, guard, nested_to, False, allow_none, excluded, included,
+                                                 allow_unmapped, pending, intern_table, child_mask)
+                else:
+                    if guard is not None:
+                        # the rest of this object is mapped by the specialized plan, next ones generically
+                        self._deoptimize(plan)
+
+                    if val is _missing or isroutine(val):
+                        continue
+
+                    if isinstance(val, list):
+                        val = [self._map_value(val_i, child_type, False, allow_none, excluded, included,
+                                               allow_unmapped, pending, intern_table, child_mask) for val_i in val]
+                    else:
+                        val = self._map_value(val, child_type, False, allow_none, excluded, included,
+                                              allow_unmapped, pending, intern_table, child_mask)
 
-            if not suppress_mapping:
-                setattr(inst, prop, val)
+            if intern_table is not None and val.__class__ in ObjectMapper.primitive_types:
+                val = intern_table.intern(prop, val)
+
+            setattr(inst, prop, val)
+
+        for prop, val in plan.constants:
+            setattr(inst, prop, val)
 
         return inst
+
+    def _map_tracked(self, from_obj, key_from, key_to, ignore_case, allow_none, excluded, included, allow_unmapped,
+                     pending, intern_table, mask, plan):
+        # type: (object, type, type, bool, bool, List[str], List[str], bool, List, InternTable, Tuple, MappingPlan) -> object
+        """Method for creating target object instance and accounting its memory allocations in memory_stats
+
+        Nested mappings are accounted to the top-level mapping pair.
+        """
+        # the peak is reset only if the tracing is owned by the mapper, so the peak of someone else is kept
+        reset_peak = self._owns_tracing and hasattr(tracemalloc, 'reset_peak')
+        if reset_peak:
+            tracemalloc.reset_peak()
+
+        self._tracking = True
+        before = tracemalloc.get_traced_memory()[0]
+        try:
+            inst = self._map_resolved(from_obj, key_from, key_to, ignore_case, allow_none, excluded, included,
+                                      allow_unmapped, pending, intern_table, mask, plan)
+        finally:
+            self._tracking = False
+        current, peak = tracemalloc.get_traced_memory()
+
+        allocated = current - before
+        # without reset_peak the peak is global since tracemalloc started, so only the retained bytes are known
+        peak = peak - before if reset_peak else allocated
+
+        stats = self.memory_stats.get((key_from, key_to))
+        if stats is None:
+            stats = self.memory_stats[(key_from, key_to)] = {'count': 0, 'allocated': 0, 'peak': 0}
+        stats['count'] += 1
+        stats['allocated'] += allocated
+        stats['peak'] = max(stats['peak'], peak)
+        return inst
+
+    def _start_tracing(self):
+        # type: () -> bool
+        """Method for starting tracemalloc for the memory tracking if it's not tracing yet
+
+        :return: True if the tracing was started and must be stopped by the caller
+        """
+        if not self.track_memory or tracemalloc.is_tracing():
+            return False
+        tracemalloc.start()
+        self._owns_tracing = True
+        return True
+
+    def _stop_tracing(self):
+        # type: () -> None
+        """Method for stopping tracemalloc started by _start_tracing"""
+        self._owns_tracing = False
+        tracemalloc.stop()
+
+    def _map_value(self, o, to_type, ignore_case, allow_none, excluded, included, allow_unmapped, pending,
+                   intern_table, mask):
+        # type: (object, Optional[type], bool, bool, List[str], List[str], bool, List, InternTable, Tuple) -> object
+        """Method for mapping the value of a source attribute
+
+        :param to_type: target type from the type hint of the target property, None to infer it
+        :param mask: field mask of the nested object, None for all fields
+        """
+        if o is not None:
+            key_from_child = o.__class__
+            if (key_from_child in self.mappings):
+                # if key_to has a mapping defined, nests the map() call
+                inner_map = self.mappings[key_from_child]
+                if to_type.__class__ is ref:
+                    # the type hints are referenced weakly by the plans with weak_registry
+                    to_type = to_type()
+                if to_type is None:
+                    key_to_child = self._resolve_to_type(key_from_child, None)
+                elif to_type in inner_map:
+                    key_to_child = to_type
+                else:
+                    # the type hint names the target type, it's not replaced by another one
+                    raise ObjectMapperException("No mapping defined for {0}.{1} -> {2}.{3}"
+                        .format(key_from_child.__module__, key_from_child.__name__, to_type.__module__,
+                                to_type.__name__))
+                return self._map_resolved(o, key_from_child, key_to_child, ignore_case, allow_none, excluded,
+                                          included, allow_unmapped, pending, intern_table, mask)
+            elif mask is not None:
+                # the values which are not mapped are copied as a whole
+                raise ObjectMapperException("Nested fields can't be selected on the value of the unmapped type {0}.{1}"
+                    .format(key_from_child.__module__, key_from_child.__name__))
+            elif (key_from_child in ObjectMapper.primitive_types):
+                # allow primitive types without mapping
+                return o
+            else:
+                # fail complex type conversion if mapping was not defined, unless explicitly allowed
+                if allow_unmapped:
+                    return o
+                else:
+                    raise ObjectMapperException("No mapping defined for {0}.{1}"
+                        .format(key_from_child.__module__, key_from_child.__name__))
+        else:
+            return None
+
+    def map_cursor(self, cursor, to_type, columns=None, batch_size=100, ignore_case=False):
+        # type: (object, type, Dict, int, bool) -> Iterator[object]
+        """Method for streaming target object instances directly from a DB-API cursor
+
+        Rows are pulled from the cursor with fetchmany() in batches of batch_size, so only one batch
+        is held in memory at a time. Rows may be plain tuples or sqlite3.Row objects.
+
+        :param cursor: DB-API cursor with an executed query
+        :param to_type: target type
+        :param columns: dictionary of column mappings in a form {'column_name': 'target_property_name'},
+                        a column mapped to None is not mapped. Columns which are not listed are
+                        mapped to the target property of the same name.
+        :param batch_size: number of rows fetched from the cursor at once
+        :param ignore_case: if set to true, ignores case when matching column names to the target attributes
+
+        :return: Generator of instances of the target class with mapped attributes
+        """
+        if (type(to_type) is not type):
+            raise ObjectMapperException("to_type must be a type")
+
+        if (columns is not None and not isinstance(columns, dict)):
+            raise ObjectMapperException("columns, if provided, must be a Dict type")
+
+        if (not isinstance(batch_size, int) or batch_size < 1):
+            raise ObjectMapperException("batch_size must be a positive integer")
+
+        if cursor.description is None:
+            raise ObjectMapperException("cursor has no result set, execute a query first")
+
+        # the plan is a list of (column index, target property) pairs resolved once per cursor
+        column_names = [d[0] for d in cursor.description]
+        to_obj_attributes = getmembers(to_type(), lambda a: not isroutine(a))
+        to_props = {k: k for k, v in to_obj_attributes}
+        if ignore_case:
+            to_props = CaseDict(to_props)
+
+        plan = []
+        for index, column in enumerate(column_names):
+            if columns is not None and column in columns:
+                prop = columns[column]
+                if prop is None:
+                    continue
+            elif column.startswith('_'):
+                continue
+            else:
+                prop = column
+
+            if prop in to_props:
+                plan.append((index, to_props[prop]))
+
+        def map_rows():
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    inst = to_type()
+                    for index, prop in plan:
+                        setattr(inst, prop, row[index])
+                    yield inst
+
+        return map_rows()
@@ -0,0 +1,57 @@
+# coding=utf-8
+"""
+Copyright (C) 2015, marazt. All rights reserved.
+"""
+import asyncio
+
+
+_done = object()
+
+
+async def amap_stream(mapper, async_iterable, to_type, batch_size, max_in_flight, options):
+    """
+    Maps objects of an async iterable in batches with a bounded read-ahead.
+    Use ObjectMapper.amap_stream, which validates the arguments.
+
+    :param mapper: the ObjectMapper
+    :param async_iterable: async iterable of the source objects
+    :param to_type: target type
+    :param batch_size: maximal number of source objects mapped at once
+    :param max_in_flight: maximal number of source objects buffered ahead of the consumer
+    :param options: other arguments of the map_batch method
+    :return: Async iterator of the mapped objects
+    """
+    # the bounded queue suspends the producer when the consumer falls behind
+    queue = asyncio.Queue(maxsize=max_in_flight)
+
+    async def produce():
+        try:
+            async for from_obj in async_iterable:
+                await queue.put((from_obj, None))
+        except Exception as ex:
+            await queue.put((_done, ex))
+        else:
+            await queue.put((_done, None))
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        finished = False
+        while not finished:
+            batch = []
+            from_obj, error = await queue.get()
+            while True:
+                if from_obj is _done:
+                    finished = True
+                    break
+                batch.append(from_obj)
+                if len(batch) >= batch_size or queue.empty():
+                    break
+                from_obj, error = queue.get_nowait()
+
+            for to_obj in mapper.map_batch(batch, to_type, **options):
+                yield to_obj
+
+            if error is not None:
+                raise error
+    finally:
+        producer.cancel()
@@ -0,0 +1,58 @@
+# coding=utf-8
+"""
+Copyright (C) 2015, marazt. All rights reserved.
+"""
+from weakref import ref
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+
+class WeakPairDict(MutableMapping):
+    """
+    A dictionary keyed by pairs of weakly referenced objects, e.g. the mapping pairs of types.
+    An item is removed when any object of its pair is garbage collected.
+    """
+
+    __slots__ = ('_data', '__weakref__')
+
+    def __init__(self):
+        # (weak reference, weak reference) => value
+        self._data = {}
+
+    # Minimum set of methods required for MutableMapping
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        for first, second in list(self._data):
+            pair = (first(), second())
+            if pair[0] is not None and pair[1] is not None:
+                yield pair
+
+    def __getitem__(self, key):
+        first, second = key
+        return self._data[(ref(first), ref(second))]
+
+    def __setitem__(self, key, value):
+        first, second = key
+        self_ref = ref(self)
+
+        def remove(_):
+            instance = self_ref()
+            if instance is not None:
+                instance._data.pop(pair, None)
+
+        # the weak references compare by their objects, so the existing pair is kept with its callbacks
+        pair = (ref(first, remove), ref(second, remove))
+        self._data[pair] = value
+
+    def __delitem__(self, key):
+        first, second = key
+        del self._data[(ref(first), ref(second))]
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, dict(self))
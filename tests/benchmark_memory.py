@@ -0,0 +1,77 @@
+# coding=utf-8
+"""
+Copyright (C) 2015, marazt. All rights reserved.
+
+Memory benchmark of the ObjectMapper mapping hot path.
+
+Usage:
+    python -m tests.benchmark_memory [number of objects]
+
+For every scenario, bytes allocated per mapped object (retained, mostly the mapped objects themselves)
+and the peak of the allocated bytes while mapping the whole batch are reported.
+"""
+from __future__ import print_function
+
+import gc
+import sys
+import tracemalloc
+
+from mapper.object_mapper import ObjectMapper
+from tests.test_object_mapper import FromTestClass, FromTestComplexChildClass, FromTestComplexClass, \
+    ToTestClass, ToTestComplexChildClass, ToTestComplexClass
+
+
+def _create_mapper():
+    mapper = ObjectMapper()
+    mapper.create_map(FromTestClass, ToTestClass)
+    mapper.create_map(FromTestComplexClass, ToTestComplexClass)
+    mapper.create_map(FromTestComplexChildClass, ToTestComplexChildClass)
+    return mapper
+
+
+def _measure(name, fnc, count):
+    """
+    Measures the memory allocated by the mapping function.
+
+    :param name: scenario name
+    :param fnc: function mapping the source objects and returning the mapped objects
+    :param count: number of mapped objects
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = fnc()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    print("{0:<32} {1:>12.1f} {2:>14.1f} {3:>12}".format(name, float(current - before) / count,
+                                                         float(peak - before) / count, peak - before))
+    return result
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    count = int(argv[0]) if argv else 10000
+
+    mapper = _create_mapper()
+    simple = [FromTestClass() for _ in range(count)]
+    nested = [FromTestComplexClass() for _ in range(count)]
+
+    # plans are built before measuring, only the steady state is reported
+    mapper.map(simple[0])
+    mapper.map(simple[0], ignore_case=True)
+    mapper.map(nested[0])
+
+    print("{0:<32} {1:>12} {2:>14} {3:>12}".format("scenario", "bytes/object", "peak/object", "peak bytes"))
+    _measure("map", lambda: [mapper.map(o) for o in simple], count)
+    _measure("map ignore_case", lambda: [mapper.map(o, ignore_case=True) for o in simple], count)
+    _measure("map_batch", lambda: mapper.map_batch(simple), count)
+    _measure("map nested", lambda: [mapper.map(o) for o in nested], count)
+    _measure("map_batch nested", lambda: mapper.map_batch(nested), count)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
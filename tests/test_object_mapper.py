@@ -2,9 +2,23 @@
 """
 Copyright (C) 2015, marazt. All rights reserved.
 """
+import asyncio
+import gc
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import tracemalloc
 import unittest
 from datetime import datetime
+from weakref import ref
+from typing import List, Optional
 
+from mapper.__main__ import main
+from mapper.intern_table import InternTable
+from mapper.mapping_functions import batched, const, path
 from mapper.object_mapper import ObjectMapper
 from mapper.object_mapper_exception import ObjectMapperException
 
@@ -84,6 +98,34 @@ class FromTestComplexClass(object):
         pass
 
 
+class ToTestAnnotatedChildClass(object):
+    """ To Test Class """
+    full_name = ""
+
+
+class ToTestAnnotatedClass(object):
+    """ To Test Class """
+    name: str = ""
+    student: Optional[ToTestAnnotatedChildClass] = None
+    knows: List[ToTestAnnotatedChildClass] = None
+
+
+class FromTestJsonClass(object):
+    """ From Test Class """
+    name: str = None
+    date: float = None
+    student: Optional[FromTestComplexChildClass] = None
+    knows: List[FromTestComplexChildClass] = None
+
+
+def create_registry():
+    """ Creates the mapper registry used by the command line tests """
+    mapper = ObjectMapper()
+    mapper.create_map(FromTestClass, ToTestClass)
+    mapper.create_map(FromTestJsonClass, ToTestComplexClass)
+    mapper.create_map(FromTestComplexChildClass, ToTestComplexChildClass)
+    return mapper
+
 
 class ObjectMapperTest(unittest.TestCase):
     """
@@ -374,6 +416,42 @@ class ObjectMapperTest(unittest.TestCase):
         self.assertEqual(result.date, from_class.date, "Date mapping must be equal")
         self.assertNotIn("surname", dir(result), "To class must not contain surname")
 
+    def test_mapping_from_objects_with_dynamic_attributes(self):
+        """ Test mapping reads only the attributes listed by dir() of objects with custom attribute access """
+
+        # Arrange
+        class FromProxyClass(object):
+            """ From Proxy Class """
+
+            def __getattr__(self, name):
+                return "dyn-" + name
+
+        class FromHiddenDateClass(object):
+            """ From Hidden Date Class """
+
+            def __init__(self):
+                self.name = "Igor"
+                self.date = "2015-01-01"
+
+            def __dir__(self):
+                return [k for k in object.__dir__(self) if k != "date"]
+
+        mapper = ObjectMapper()
+        mapper.create_map(FromProxyClass, ToTestClass)
+        mapper.create_map(FromHiddenDateClass, ToTestClass)
+
+        # Act
+        proxy = mapper.map(FromProxyClass())
+        proxy_ignore_case = mapper.map(FromProxyClass(), ignore_case=True)
+        hidden = mapper.map(FromHiddenDateClass())
+
+        # Assert
+        self.assertEqual((proxy.name, proxy.date), ("", ""), "Dynamic attributes must not be mapped")
+        self.assertEqual((proxy_ignore_case.name, proxy_ignore_case.date), ("", ""),
+                         "Case insensitive mapping must agree")
+        self.assertEqual(hidden.name, "Igor", "Listed attribute must be mapped")
+        self.assertEqual(hidden.date, "", "Attribute hidden by __dir__ must not be mapped")
+
     def test_mapping_excluded_field(self):
         """Test mapping with excluded fields"""
         # Arrange
@@ -448,4 +526,818 @@ class ObjectMapperTest(unittest.TestCase):
         self.assertEqual(len(result.knows), len(from_class.knows), "number of entries must be the same for Knows")
         self.assertTrue(all(isinstance(k, ToTestComplexChildClass) for k in result.knows), "Children target types must be same")
         self.assertEqual(result.knows[0].full_name, from_class.knows[0].full_name, "StudentName(0) mapping must be equal")
-        self.assertEqual(result.knows[1].full_name, from_class.knows[1].full_name, "StudentName(1) mapping must be equal")
\ No newline at end of file
+        self.assertEqual(result.knows[1].full_name, from_class.knows[1].full_name, "StudentName(1) mapping must be equal")
+
+    def test_mapping_from_cursor_rows(self):
+        """ Test streaming mapping from sqlite3 cursor rows """
+
+        # Arrange
+        connection = sqlite3.connect(":memory:")
+        connection.execute("CREATE TABLE person (name TEXT, surname TEXT, Date TEXT)")
+        connection.executemany("INSERT INTO person VALUES (?, ?, ?)",
+                               [("Igor", "Hnizdo", "2015-01-01"), ("Eda", "Soucek", "2016-01-01"),
+                                ("Jan", "Triska", "2017-01-01")])
+        mapper = ObjectMapper()
+
+        # Act
+        tuple_cursor = connection.execute("SELECT name, surname, Date FROM person ORDER BY name")
+        tuple_result = list(mapper.map_cursor(tuple_cursor, ToTestClass, batch_size=2, ignore_case=True))
+
+        connection.row_factory = sqlite3.Row
+        row_cursor = connection.execute("SELECT name, surname, Date FROM person ORDER BY name")
+        row_result = list(mapper.map_cursor(row_cursor, ToTestClass, columns={"surname": "name", "name": None}))
+
+        # Assert
+        self.assertEqual(len(tuple_result), 3, "All rows must be mapped")
+        self.assertTrue(all(isinstance(r, ToTestClass) for r in tuple_result), "Target types must be same")
+        self.assertEqual([r.name for r in tuple_result], ["Eda", "Igor", "Jan"], "Name mapping must be equal")
+        self.assertEqual(tuple_result[0].date, "2016-01-01", "Date must be mapped ignoring case")
+        self.assertNotIn("surname", tuple_result[0].__dict__, "To class must not contain surname")
+
+        self.assertEqual([r.name for r in row_result], ["Soucek", "Hnizdo", "Triska"],
+                         "Name must be mapped from the surname column")
+        self.assertEqual(row_result[0].date, "", "Date must not be mapped with case sensitivity")
+
+    def test_mapping_from_cursor_fetches_in_batches(self):
+        """ Test streaming mapping from cursor fetches rows lazily in batches """
+
+        # Arrange
+        connection = sqlite3.connect(":memory:")
+        connection.execute("CREATE TABLE person (name TEXT)")
+        connection.executemany("INSERT INTO person VALUES (?)", [("n{0}".format(i),) for i in range(10)])
+        fetched = []
+
+        class CountingCursor(object):
+            def __init__(self, cursor):
+                self.cursor = cursor
+                self.description = cursor.description
+
+            def fetchmany(self, size):
+                rows = self.cursor.fetchmany(size)
+                fetched.append(len(rows))
+                return rows
+
+        mapper = ObjectMapper()
+        cursor = CountingCursor(connection.execute("SELECT name FROM person"))
+
+        # Act
+        result = mapper.map_cursor(cursor, ToTestClass, batch_size=4)
+        first = next(result)
+
+        # Assert
+        self.assertEqual(first.name, "n0", "Name mapping must be equal")
+        self.assertEqual(fetched, [4], "Only the first batch must be fetched")
+        self.assertEqual(len(list(result)), 9, "Remaining rows must be mapped")
+        self.assertEqual(fetched, [4, 4, 2, 0], "Rows must be fetched in batches")
+
+    def test_mapping_from_cursor_without_result_set(self):
+        """ Test streaming mapping from cursor without executed query """
+
+        # Arrange
+        mapper = ObjectMapper()
+        cursor = sqlite3.connect(":memory:").cursor()
+
+        # Act & Assert
+        with self.assertRaises(ObjectMapperException):
+            mapper.map_cursor(cursor, ToTestClass)
+        with self.assertRaises(ObjectMapperException):
+            mapper.map_cursor(cursor, ToTestClass, batch_size=0)
+
+    def test_mapping_jsonl_from_command_line(self):
+        """ Test JSONL mapping from command line with worker processes """
+
+        # Arrange
+        directory = tempfile.mkdtemp()
+        input_path = os.path.join(directory, "input.jsonl")
+        output_path = os.path.join(directory, "output.jsonl")
+        with open(input_path, "w") as f:
+            for i in range(25):
+                f.write(json.dumps({"name": "Igor {0}".format(i), "surname": "Hnizdo", "date": "2015-01-01"}) + "\n")
+
+        try:
+            for extra in ([], ["--workers", "3", "--chunk-size", "4"], ["--mmap"]):
+                # Act
+                code = main([input_path, "-o", output_path, "--registry", "tests.test_object_mapper:create_registry",
+                             "--from", "FromTestClass", "--to", "ToTestClass"] + extra)
+                with open(output_path) as f:
+                    result = [json.loads(line) for line in f]
+
+                # Assert
+                self.assertEqual(code, 0, "Exit code must be zero")
+                self.assertEqual(len(result), 25, "All records must be mapped")
+                self.assertEqual([r["name"] for r in result], ["Igor {0}".format(i) for i in range(25)],
+                                 "Output must keep the input order")
+                self.assertEqual(result[0], {"name": "Igor 0", "date": "2015-01-01"},
+                                 "Only target attributes must be written")
+        finally:
+            shutil.rmtree(directory)
+
+    def test_mapping_jsonl_with_nested_objects_from_command_line(self):
+        """ Test JSONL mapping from command line with float values and nested objects """
+
+        # Arrange
+        directory = tempfile.mkdtemp()
+        input_path = os.path.join(directory, "input.jsonl")
+        output_path = os.path.join(directory, "output.jsonl")
+        with open(input_path, "w") as f:
+            f.write(json.dumps({"name": "Igor", "date": 1.5, "student": {"full_name": "Eda Soucek"},
+                                "knows": [{"full_name": "Mrs. Souckova"}]}) + "\n")
+
+        try:
+            # Act
+            code = main([input_path, "-o", output_path, "--registry", "tests.test_object_mapper:create_registry",
+                         "--from", "FromTestJsonClass", "--to", "ToTestComplexClass"])
+            with open(output_path) as f:
+                result = [json.loads(line) for line in f]
+
+            # Assert
+            self.assertEqual(code, 0, "Exit code must be zero")
+            self.assertEqual(result, [{"name": "Igor", "date": 1.5, "student": {"full_name": "Eda Soucek"},
+                                       "knows": [{"full_name": "Mrs. Souckova"}]}],
+                             "Floats must be copied and nested objects mapped")
+        finally:
+            shutil.rmtree(directory)
+
+    def test_mapping_batch(self):
+        """ Test mapping of a batch of source objects """
+
+        # Arrange
+        from_classes = [FromTestClass(), None, FromTestClass()]
+        from_classes[2].name = "Eda"
+        mapper = ObjectMapper()
+        mapper.create_map(FromTestClass, ToTestClass)
+
+        # Act
+        result = mapper.map_batch(from_classes, ToTestClass, allow_none=True)
+
+        # Assert
+        self.assertEqual(len(result), 3, "All objects must be mapped")
+        self.assertTrue(isinstance(result[0], ToTestClass), "Target types must be same")
+        self.assertIsNone(result[1], "None must be mapped to None")
+        self.assertEqual([result[0].name, result[2].name], ["Igor", "Eda"], "Name mapping must be equal")
+
+    def test_mapping_batch_resolves_plan_once(self):
+        """ Test batch mapping resolves the mapping plan once per source class """
+
+        # Arrange
+        mapper = ObjectMapper()
+        mapper.create_map(FromTestClass, ToTestClass)
+        get_plan = mapper._get_plan
+        calls = []
+
+        def counting_get_plan(*args):
+            calls.append(args[:2])
+            return get_plan(*args)
+
+        mapper._get_plan = counting_get_plan
+
+        # Act
+        result = mapper.map_batch([FromTestClass() for _ in range(100)], excluded=["surname"])
+
+        # Assert
+        self.assertEqual(len(result), 100, "All objects must be mapped")
+        self.assertEqual(calls, [(FromTestClass, ToTestClass)], "Plan must be resolved once per batch")
+
+    def test_mapping_async_stream_with_backpressure(self):
+        """ Test mapping of an async stream with bounded read-ahead """
+
+        # Arrange
+        produced = []
+        consumed = []
+        max_ahead = []
+        mapper = ObjectMapper()
+        mapper.create_map(FromTestClass, ToTestClass)
+
+        async def source():
+            for i in range(50):
+                from_class = FromTestClass()
+                from_class.name = "n{0}".format(i)
+                produced.append(i)
+                yield from_class
+
+        async def consume():
+            async for result in mapper.amap_stream(source(), ToTestClass, batch_size=4, max_in_flight=8):
+                consumed.append(result.name)
+                max_ahead.append(len(produced) - len(consumed))
+                await asyncio.sleep(0)
+
+        # Act
+        asyncio.run(consume())
+
+        # Assert
+        self.assertEqual(consumed, ["n{0}".format(i) for i in range(50)], "Stream order must be kept")
+        self.assertLessEqual(max(max_ahead), 8 + 4 + 1, "Producer must not run ahead of the consumer")
+
+    def test_mapping_async_stream_propagates_errors(self):
+        """ Test mapping of an async stream propagates source errors """
+
+        # Arrange
+        mapper = ObjectMapper()
+        mapper.create_map(FromTestClass, ToTestClass)
+
+        async def source():
+            yield FromTestClass()
+            raise ValueError("broken source")
+
+        async def consume():
+            return [r async for r in mapper.amap_stream(source(), ToTestClass)]
+
+        # Act & Assert
+        with self.assertRaises(ValueError):
+            asyncio.run(consume())
+        with self.assertRaises(ObjectMapperException):
+            mapper.amap_stream(source(), ToTestClass, max_in_flight=0)
+
+    def test_mapping_reads_only_needed_source_attributes(self):
+        """ Test mapping does not evaluate source properties which are not needed by the target """
+
+        # Arrange
+        evaluated = []
+
+        class FromLazyClass(object):
+            """ From Lazy Class """
+
+            def __init__(self):
+                self.name = "Igor"
+
+            @property
+            def orders(self):
+                evaluated.append("orders")
+                return []
+
+            @property
+            def date(self):
+                evaluated.append("date")
+                return datetime(2015, 1, 1)
+
+            @property
+            def Surname(self):
+                evaluated.append("surname")
+                return "Hnizdo"
+
+        mapper = ObjectMapper()
+        mapper.create_map(FromLazyClass, ToTestClass, {"_actor_name": lambda o: o.name})
+
+        # Act
+        result1 = mapper.map(FromLazyClass(), excluded=["date"])
+        result2 = mapper.map(FromLazyClass(), ignore_case=True)
+
+        # Assert
+        self.assertEqual(result1.name, "Igor", "Name mapping must be equal")
+        self.assertEqual(result1._actor_name, "Igor", "Custom mapping must be used")
+        self.assertEqual(result1.date, "", "Date must not be mapped")
+        self.assertEqual(result2.date, datetime(2015, 1, 1), "Date mapping must be equal")
+        self.assertEqual(evaluated, ["date"], "Only the needed properties must be evaluated")
+
+    def test_mapping_nested_by_type_hints(self):
+        """ Test nested mapping target is resolved from the type hints of the target class """
+
+        # Arrange
+        from_class = FromTestComplexClass()
+        mapper = ObjectMapper()
+        mapper.create_map(FromTestComplexClass, ToTestAnnotatedClass)
+        mapper.create_map(FromTestComplexChildClass, ToTestComplexChildClass)
+        mapper.create_map(FromTestComplexChildClass, ToTestAnnotatedChildClass)
+
+        # Act
+        result = mapper.map(from_class)
+
+        # Assert
+        self.assertTrue(isinstance(result.student, ToTestAnnotatedChildClass), "Target type must be from type hint")
+        self.assertEqual(result.student.full_name, from_class.student.full_name, "StudentName mapping must be equal")
+        self.assertTrue(all(isinstance(k, ToTestAnnotatedChildClass) for k in result.knows),
+                        "Children target types must be from type hint")
+        self.assertEqual([k.full_name for k in result.knows], [k.full_name for k in from_class.knows],
+                         "Children mapping must be equal")
+
+    def test_mapping_nested_ambiguous_without_type_hints(self):
+        """ Test nested mapping without type hints fails for ambiguous mappings """
+
+        # Arrange
+        mapper = ObjectMapper()
+        mapper.create_map(FromTestComplexClass, ToTestComplexClass)
+        mapper.create_map(FromTestComplexChildClass, ToTestComplexChildClass)
+        mapper.create_map(FromTestComplexChildClass, ToTestAnnotatedChildClass)
+
+        # Act & Assert
+        with self.assertRaises(ObjectMapperException):
+            mapper.map(FromTestComplexClass())
+
+    def test_mapping_nested_with_unregistered_type_hint(self):
+        """ Test nested mapping fails if the type hint names a target type not registered for the source """
+
+        # Arrange
+        single = ObjectMapper()
+        single.create_map(FromTestComplexClass, ToTestAnnotatedClass)
+        single.create_map(FromTestComplexChildClass, ToTestComplexChildClass)
+        ambiguous = ObjectMapper(specialize_after=1)
+        ambiguous.create_map(FromTestComplexClass, ToTestAnnotatedClass)
+        ambiguous.create_map(FromTestComplexChildClass, ToTestComplexChildClass)
+        ambiguous.create_map(FromTestComplexChildClass, ToTestClassTwo)
+
+        # Act & Assert
+        for mapper in (single, ambiguous):
+            with self.assertRaises(ObjectMapperException) as ctx:
+                mapper.map(FromTestComplexClass())
+            self.assertEqual(str(ctx.exception),
+                             "No mapping defined for tests.test_object_mapper.FromTestComplexChildClass -> "
+                             "tests.test_object_mapper.ToTestAnnotatedChildClass")
+
+    def test_mapping_with_batched_mapping_function(self):
+        """ Test mapping with batched mapping function """
+
+        # Arrange
+        calls = []
+
+        def lookup(objs):
+            calls.append(len(objs))
+            return ["{0} {1}".format(o.name, o.surname) for o in objs]
+
+        from_classes = [FromTestClass() for _ in range(5)]
+        for i, from_class in enumerate(from_classes):
+            from_class.surname = str(i)
+        mapper = ObjectMapper()
+        mapper.create_map(FromTestClass, ToTestClass, {"name": batched(lookup)})
+
+        # Act
+        result = mapper.map_batch(from_classes, ToTestClass)
+        single = mapper.map(from_classes[0])
+
+        # Assert
+        self.assertEqual([r.name for r in result], ["Igor {0}".format(i) for i in range(5)],
+                         "Name mapping must be equal")
+        self.assertEqual(result[0].date, from_classes[0].date, "Date mapping must be equal")
+        self.assertEqual(single.name, "Igor 0", "Single object must be mapped as a batch of one")
+        self.assertEqual(calls, [5, 1], "Batched function must be called once per batch")
+
+    def test_mapping_with_nested_batched_mapping_function(self):
+        """ Test batched mapping function of a nested mapping is called once per batch """
+
+        # Arrange
+        calls = []
+
+        def lookup(objs):
+            calls.append(len(objs))
+            return [o.full_name.upper() for o in objs]
+
+        from_classes = [FromTestComplexClass() for _ in range(5)]
+        mapper = ObjectMapper()
+        mapper.create_map(FromTestComplexClass, ToTestComplexClass)
+        mapper.create_map(FromTestComplexChildClass, ToTestComplexChildClass, {"full_name": batched(lookup)})
+
+        # Act
+        result = mapper.map_batch(from_classes, ToTestComplexClass, intern=["full_name"])
+
+        # Assert
+        self.assertEqual(calls, [15], "Batched function must be called once for all nested objects")
+        self.assertTrue(all(r.student.full_name == "EDA SOUCEK" for r in result), "StudentName mapping must be equal")
+        self.assertEqual([k.full_name for k in result[4].knows], ["MRS. SOUCKOVA", "THE SCHOOLMASTER"],
+                         "Children mapping must be equal")
+        self.assertIs(result[0].student.full_name, result[4].student.full_name, "Batched values must be interned")
+
+    def test_mapping_with_invalid_batched_mapping_function(self):
+        """ Test mapping with batched mapping function returning wrong number of values """
+
+        # Arrange
+        mapper = ObjectMapper()
+        mapper.create_map(FromTestClass, ToTestClass, {"name": batched(lambda objs: ["one"])})
+
+        # Act & Assert
+        with self.assertRaises(ObjectMapperException) as ctx:
+            mapper.map_batch([FromTestClass(), FromTestClass()], ToTestClass)
+        self.assertEqual(str(ctx.exception), "Batched mapping function returned 1 values for 2 objects "
+                                             "while setting property ToTestClass.name")
+
+    def test_mapping_with_memory_tracking(self):
+        """ Test mapping with memory tracking per mapping pair """
+
+        # Arrange
+        self.assertFalse(tracemalloc.is_tracing(), "Tracing must not be started by other tests")
+        mapper = ObjectMapper(track_memory=True)
+        mapper.create_map(FromTestComplexClass, ToTestComplexClass)
+        mapper.create_map(FromTestComplexChildClass, ToTestComplexChildClass)
+
+        # Act
+        result = mapper.map_batch([FromTestComplexClass() for _ in range(3)])
+
+        # Assert
+        self.assertEqual(len(result), 3, "All objects must be mapped")
+        self.assertFalse(tracemalloc.is_tracing(), "Tracing started by the mapper must be stopped")
+        self.assertEqual(list(mapper.memory_stats), [(FromTestComplexClass, ToTestComplexClass)],
+                         "Nested mappings must be accounted to the top-level pair")
+        stats = mapper.memory_stats[(FromTestComplexClass, ToTestComplexClass)]
+        self.assertEqual(stats["count"], 3, "All mappings must be counted")
+        self.assertGreater(stats["allocated"], 0, "Mapped objects must be accounted")
+        self.assertGreaterEqual(stats["peak"], stats["allocated"] // 3, "Peak must cover the retained bytes")
+
+    def test_mapping_with_memory_tracking_of_batched_mapping_functions(self):
+        """ Test memory tracking accounts the values of batched mapping functions to the top-level pair """
+
+        # Arrange
+        mapper = ObjectMapper(track_memory=True)
+        mapper.create_map(FromTestClass, ToTestClass,
+                          {"name": batched(lambda objs: [str(i) * 100000 for i in range(len(objs))])})
+
+        # Act
+        result = mapper.map_batch([FromTestClass() for _ in range(3)])
+
+        # Assert
+        self.assertEqual([len(r.name) for r in result], [100000] * 3, "Batched values must be mapped")
+        self.assertFalse(tracemalloc.is_tracing(), "Tracing started by the mapper must be stopped")
+        self.assertGreaterEqual(mapper.memory_stats[(FromTestClass, ToTestClass)]["allocated"], 3 * 100000,
+                                "Values of batched mapping functions must be accounted")
+
+    def test_mapping_with_memory_tracking_keeps_external_tracing(self):
+        """ Test memory tracking neither stops nor resets the peak of the tracing started outside of the mapper """
+
+        # Arrange
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        buffer = bytearray(1 << 20)
+        del buffer
+        peak = tracemalloc.get_traced_memory()[1]
+        mapper = ObjectMapper(track_memory=True)
+        mapper.create_map(FromTestClass, ToTestClass)
+
+        # Act
+        mapper.map(FromTestClass())
+
+        # Assert
+        self.assertTrue(tracemalloc.is_tracing(), "External tracing must not be stopped")
+        self.assertGreaterEqual(tracemalloc.get_traced_memory()[1], peak, "External peak must not be reset")
+        stats = mapper.memory_stats[(FromTestClass, ToTestClass)]
+        self.assertEqual(stats["peak"], stats["allocated"], "Only the retained bytes must be reported")
+
+    def test_mapping_with_memory_tracking_and_weak_registry(self):
+        """ Test memory stats of collected types are removed with weak registry """
+
+        # Arrange
+        mapper = ObjectMapper(track_memory=True, weak_registry=True, plan_cache_size=1)
+
+        # Act
+        for i in range(5):
+            from_type = type("FromTenant{0}".format(i), (FromTestClass,), {})
+            to_type = type("ToTenant{0}".format(i), (ToTestClass,), {})
+            mapper.create_map(from_type, to_type)
+            mapper.map(from_type(), to_type)
+            del from_type, to_type
+        gc.collect()
+
+        # Assert
+        self.assertEqual(len(mapper.memory_stats), 0, "Stats must be removed with the types")
+
+    def test_mapping_batch_with_interning(self):
+        """ Test batch mapping shares equal values of interned properties and types """
+
+        # Arrange
+        from_classes = [FromTestClass() for _ in range(4)]
+        for from_class in from_classes:
+            from_class.name = "".join(["Ig", "or"])
+            from_class.date = datetime(2015, 1, 1)
+        mapper = ObjectMapper()
+        mapper.create_map(FromTestClass, ToTestClass)
+
+        # Act
+        plain = mapper.map_batch(from_classes, ToTestClass)
+        interned = mapper.map_batch(from_classes, ToTestClass, intern=["name", datetime])
+
+        # Assert
+        self.assertIsNot(plain[0].date, plain[1].date, "Values must not be shared by default")
+        self.assertTrue(all(r.name is interned[0].name for r in interned), "Interned property values must be shared")
+        self.assertTrue(all(r.date is interned[0].date for r in interned), "Interned type values must be shared")
+        self.assertEqual(interned[0].date, datetime(2015, 1, 1), "Date mapping must be equal")
+
+    def test_mapping_batch_with_bounded_intern_table(self):
+        """ Test batch mapping with intern table shared across batches """
+
+        # Arrange
+        from_classes = [FromTestClass() for _ in range(4)]
+        for i, from_class in enumerate(from_classes):
+            from_class.date = datetime(2015, 1, 1 + i % 2)
+        table = InternTable(types=[datetime], max_size=1)
+        mapper = ObjectMapper()
+        mapper.create_map(FromTestClass, ToTestClass)
+
+        # Act
+        first = mapper.map_batch(from_classes[:2], ToTestClass, intern=table)
+        second = mapper.map_batch(from_classes[2:], ToTestClass, intern=table)
+
+        # Assert
+        self.assertEqual(len(table), 1, "Table must be bounded")
+        self.assertIs(second[0].date, first[0].date, "Values must be shared across batches")
+        self.assertIsNot(second[1].date, first[1].date, "Values must not be interned when the table is full")
+        with self.assertRaises(ObjectMapperException):
+            mapper.map_batch(from_classes, ToTestClass, intern=[list])
+
+    def test_mapping_with_nested_field_mask(self):
+        """ Test mapping with nested field paths """
+
+        # Arrange
+        from_class = FromTestComplexClass()
+        mapper = ObjectMapper()
+        mapper.create_map(FromTestComplexClass, ToTestComplexClass)
+        mapper.create_map(FromTestComplexChildClass, ToTestComplexClass)
+
+        # Act
+        result1 = mapper.map(from_class, fields=["name", "student.name", "knows[].date"])
+        result2 = mapper.map_batch([from_class], fields=["knows", "student.student"])[0]
+
+        # Assert
+        self.assertEqual(result1.name, from_class.name, "Name mapping must be equal")
+        self.assertEqual(result1.date, "", "Date must not be mapped")
+        self.assertTrue(isinstance(result1.student, ToTestComplexClass), "Target types must be same")
+        self.assertEqual(result1.student.name, "", "Nested field not present in the source must not be mapped")
+        self.assertNotIn("full_name", result1.student.__dict__, "Nested field must be pruned")
+        self.assertEqual(len(result1.knows), 2, "List items must be mapped")
+        self.assertEqual(result2.name, "", "Name must not be mapped")
+        self.assertIsNone(result2.student.student, "Nested field must be mapped")
+        self.assertEqual(len(result2.knows), 2, "Whole list must be mapped")
+
+    def test_mapping_with_field_mask_does_not_read_pruned_fields(self):
+        """ Test mapping with field paths does not read the pruned source attributes """
+
+        # Arrange
+        evaluated = []
+
+        class FromLazyChildClass(object):
+            """ From Lazy Child Class """
+
+            @property
+            def full_name(self):
+                evaluated.append("full_name")
+                return "Eda Soucek"
+
+        class FromLazyClass(object):
+            """ From Lazy Class """
+
+            def __init__(self):
+                self.name = "Igor"
+                self.student = FromLazyChildClass()
+
+            @property
+            def knows(self):
+                evaluated.append("knows")
+                return []
+
+        from_class = FromLazyClass()
+        mapper = ObjectMapper()
+        mapper.create_map(FromLazyClass, ToTestComplexClass)
+        mapper.create_map(FromLazyChildClass, ToTestComplexChildClass)
+
+        # Act
+        result = mapper.map(from_class, fields=["name", "student"])
+        pruned = mapper.map(from_class, fields=["Name"], ignore_case=True)
+
+        # Assert
+        self.assertEqual(result.student.full_name, "Eda Soucek", "StudentName mapping must be equal")
+        self.assertEqual(pruned.name, from_class.name, "Name mapping must ignore case")
+        self.assertIsNone(pruned.student, "Student must not be mapped")
+        self.assertEqual(evaluated, ["full_name"], "Pruned properties must not be evaluated")
+        with self.assertRaises(ObjectMapperException):
+            mapper.map(from_class, fields=["student..name"])
+
+    def test_mapping_with_invalid_field_mask(self):
+        """ Test mapping with field paths which can't be applied """
+
+        # Arrange
+        from_class = FromTestComplexClass()
+        mapper = ObjectMapper()
+        mapper.create_map(FromTestComplexClass, ToTestComplexClass, {"student": lambda f: f.student.full_name})
+        mapper.create_map(FromTestComplexChildClass, ToTestComplexChildClass)
+
+        # Act & Assert
+        for fields in ("name", [["name"]], ["name", None]):
+            with self.assertRaises(ObjectMapperException) as ctx:
+                mapper.map(from_class, fields=fields)
+            self.assertEqual(str(ctx.exception), "fields must be a list of field paths")
+        with self.assertRaises(ObjectMapperException) as ctx:
+            mapper.map(from_class, fields=["student.full_name"])
+        self.assertEqual(str(ctx.exception),
+                         "Nested fields can't be selected on the custom mapped property ToTestComplexClass.student")
+        with self.assertRaises(ObjectMapperException) as ctx:
+            mapper.map(from_class, fields=["name.first"])
+        self.assertEqual(str(ctx.exception),
+                         "Nested fields can't be selected on the value of the unmapped type builtins.str")
+
+    def test_mapping_removal(self):
+        """ Test mapping removal """
+
+        # Arrange
+        mapper = ObjectMapper()
+        mapper.create_map(FromTestClass, ToTestClass)
+        mapper.create_map(FromTestClass, ToTestClassTwo)
+        mapper.map(FromTestClass(), ToTestClass)
+
+        # Act
+        mapper.remove_map(FromTestClass, ToTestClass)
+        result = mapper.map(FromTestClass())
+        mapper.remove_map(FromTestClass, ToTestClassTwo)
+
+        # Assert
+        self.assertTrue(isinstance(result, ToTestClassTwo), "Remaining mapping must be inferred")
+        self.assertNotIn(FromTestClass, mapper.mappings, "Empty mappings must be removed")
+        with self.assertRaises(ObjectMapperException):
+            mapper.remove_map(FromTestClass, ToTestClass)
+        with self.assertRaises(ObjectMapperException):
+            mapper.map(FromTestClass())
+
+    def test_mapping_registration_keeps_plans_of_other_types(self):
+        """ Test mapping registration and removal invalidate only the plans depending on the source type """
+
+        # Arrange
+        mapper = ObjectMapper(specialize_after=1)
+        mapper.create_map(FromTestClass, ToTestClass)
+        mapper.create_map(FromTestComplexClass, ToTestComplexClass)
+        mapper.create_map(FromTestComplexChildClass, ToTestComplexChildClass)
+        mapper.map(FromTestClass())
+        mapper.map(FromTestComplexClass())
+        mapper.map(FromTestComplexClass())
+        plan = mapper._get_plan(FromTestClass, ToTestClass, False, None, None)
+        complex_plan = mapper._get_plan(FromTestComplexClass, ToTestComplexClass, False, None, None)
+
+        # Act
+        mapper.create_map(FromTestClass, ToTestComplexClass)
+        kept = mapper._get_plan(FromTestComplexClass, ToTestComplexClass, False, None, None)
+        mapper.remove_map(FromTestComplexChildClass, ToTestComplexChildClass)
+
+        # Assert
+        self.assertIsNot(mapper._get_plan(FromTestClass, ToTestClass, False, None, None), plan,
+                         "Plans of the registered source type must be rebuilt")
+        self.assertIs(kept, complex_plan, "Plans of other types must be kept")
+        self.assertIsNotNone(complex_plan.specialized, "Plan must be specialized for the nested type")
+        self.assertIsNot(mapper._get_plan(FromTestComplexClass, ToTestComplexClass, False, None, None), complex_plan,
+                         "Plans specialized for the removed nested mapping must be rebuilt")
+        with self.assertRaises(ObjectMapperException):
+            mapper.map(FromTestComplexClass())
+
+    def test_mapping_with_weak_registry(self):
+        """ Test mappings and plans of collected types are removed with weak registry """
+
+        # Arrange
+        mapper = ObjectMapper(weak_registry=True, specialize_after=1)
+        type_refs = []
+
+        # Act
+        for i in range(10):
+            from_child_type = type("FromTenantChild{0}".format(i), (FromTestComplexChildClass,), {})
+            to_child_type = type("ToTenantChild{0}".format(i), (ToTestComplexChildClass,), {})
+            from_type = type("FromTenant{0}".format(i), (FromTestClass,), {})
+            to_type = type("ToTenant{0}".format(i), (ToTestComplexClass,), {"__annotations__": {"student": to_child_type}})
+            mapper.create_map(from_type, to_type)
+            mapper.create_map(from_child_type, to_child_type)
+            from_class = from_type()
+            from_class.student = from_child_type()
+            result = mapper.map_batch([from_class, from_class], to_type)
+            result = mapper.map(from_class, to_type)
+            self.assertTrue(isinstance(result.student, to_child_type), "Target type must be from type hint")
+            type_refs.extend(ref(t) for t in (from_type, to_type, from_child_type, to_child_type))
+            del from_child_type, to_child_type, from_type, to_type, from_class, result
+        gc.collect()
+
+        # Assert
+        self.assertEqual([r for r in type_refs if r() is not None], [], "Types must not be kept alive")
+        self.assertEqual(len(mapper.mappings), 0, "Mappings of collected types must be removed")
+        self.assertEqual(len(mapper._plans), 0, "Plans of collected types must be removed")
+
+    def test_mapping_with_bounded_plan_cache(self):
+        """ Test plan and field mask caches are bounded """
+
+        # Arrange
+        mapper = ObjectMapper(plan_cache_size=2)
+        mapper.create_map(FromTestClass, ToTestClass)
+
+        # Act
+        for i in range(10):
+            result = mapper.map(FromTestClass(), fields=["name{0}".format(i)])
+
+        # Assert
+        self.assertEqual(result.name, "", "Name must not be mapped")
+        self.assertEqual(len(mapper._plans), 2, "Plan cache must be bounded")
+        self.assertEqual(len(mapper._masks), 2, "Field mask cache must be bounded")
+
+    def test_mapping_with_declarative_mapping_functions(self):
+        """ Test mapping with path and constant mapping functions """
+
+        # Arrange
+        from_class = FromTestComplexClass()
+        from_empty = FromTestComplexClass()
+        from_empty.student = None
+        mapper = ObjectMapper()
+        mapper.create_map(FromTestComplexClass, ToTestClass,
+                          {"name": "student.full_name",
+                           "date": path("date", convert=["date", "isoformat"]),
+                           "_actor_name": const("Jan Triska")})
+        mapper.create_map(FromTestComplexClass, ToTestComplexChildClass,
+                          {"full_name": path("student.full_name", convert="upper", default="nobody")})
+
+        # Act
+        result = mapper.map(from_class, ToTestClass)
+        upper = mapper.map(from_class, ToTestComplexChildClass)
+        empty = mapper.map(from_empty, ToTestClass)
+        default = mapper.map(from_empty, ToTestComplexChildClass)
+
+        # Assert
+        self.assertEqual(result.name, from_class.student.full_name, "Name must be mapped by path")
+        self.assertEqual(result.date, "2015-01-01", "Date must be converted")
+        self.assertEqual(result._actor_name, "Jan Triska", "Constant must be mapped")
+        self.assertEqual(upper.full_name, "EDA SOUCEK", "Converter must be applied")
+        self.assertIsNone(empty.name, "None on the path must be mapped to None")
+        self.assertEqual(default.full_name, "nobody", "None on the path must be mapped to default")
+
+    def test_mapping_with_declarative_mapping_functions_reads_path_once(self):
+        """ Test path functions read every attribute on the path once and constants are not called """
+
+        # Arrange
+        evaluated = []
+
+        class FromLazyClass(object):
+            """ From Lazy Class """
+
+            def __init__(self):
+                self.name = "Igor"
+
+            @property
+            def student(self):
+                evaluated.append("student")
+                return None
+
+        mapper = ObjectMapper()
+        mapper.create_map(FromLazyClass, ToTestClass, {"name": "student.full_name", "date": "name",
+                                                       "_actor_name": const("Jan Triska")})
+        plan = mapper._get_plan(FromLazyClass, ToTestClass, False, None, None)
+
+        # Act
+        result = mapper.map(FromLazyClass(), ToTestClass)
+
+        # Assert
+        self.assertIsNone(result.name, "None on the path must be mapped to None")
+        self.assertEqual(evaluated, ["student"], "Attributes on the path must be read once")
+        self.assertEqual(result.date, "Igor", "Single attribute must be mapped by path")
+        self.assertEqual(result._actor_name, "Jan Triska", "Constant must be mapped")
+        self.assertEqual(plan.constants, [("_actor_name", "Jan Triska")], "Constant must be stored as a value")
+        self.assertIs(dict((f[0], f[1]) for f in plan.fields)["date"],
+                      mapper.mappings[FromLazyClass][ToTestClass][1]["date"].getter,
+                      "Single attribute path must be bound to the attribute getter")
+
+    def test_mapping_with_invalid_path(self):
+        """ Test mapping with path to a missing attribute """
+
+        # Arrange
+        mapper = ObjectMapper()
+        mapper.create_map(FromTestComplexClass, ToTestClass, {"name": "student.nickname"})
+
+        # Act & Assert
+        with self.assertRaises(ObjectMapperException) as ctx:
+            mapper.map(FromTestComplexClass())
+        self.assertEqual(str(ctx.exception), "Invalid mapping function while setting property ToTestClass.name")
+        with self.assertRaises(ObjectMapperException):
+            path("student..name")
+        with self.assertRaises(ObjectMapperException):
+            path("name", convert="unknown")
+
+    def test_declarative_mapping_functions_pickling(self):
+        """ Test declarative mapping functions can be pickled """
+
+        # Arrange
+        functions = [path("student.full_name", convert=["strip", "upper"], default=""), const(42)]
+
+        # Act
+        restored = pickle.loads(pickle.dumps(functions))
+
+        # Assert
+        self.assertEqual(restored[0](FromTestComplexClass()), "EDA SOUCEK", "Path function must be restored")
+        self.assertEqual(restored[1](None), 42, "Constant function must be restored")
+
+    def test_mapping_with_specialized_plans(self):
+        """ Test mapping with plans specialized for the observed types """
+
+        # Arrange
+        mapper = ObjectMapper(specialize_after=3)
+        mapper.create_map(FromTestComplexClass, ToTestComplexClass)
+        mapper.create_map(FromTestComplexChildClass, ToTestComplexChildClass)
+        from_classes = [FromTestComplexClass() for _ in range(5)]
+        from_changed = FromTestComplexClass()
+        from_changed.date = "2015-01-01"
+        from_changed.student = None
+
+        # Act
+        warm_up = mapper.map_batch(from_classes[:3])
+        stats_after_warm_up = dict(mapper.specialization_stats)
+        specialized = mapper.map_batch(from_classes[3:])
+        changed = mapper.map(from_changed)
+        generic = mapper.map(from_classes[0])
+
+        # Assert
+        self.assertEqual(stats_after_warm_up, {"specializations": 2, "deopts": 0},
+                         "Parent and child plans must be specialized after the warm-up")
+        for result, from_class in zip(warm_up + specialized + [generic], from_classes[:5] + [from_classes[0]]):
+            self.assertEqual(result.name, from_class.name, "Name mapping must be equal")
+            self.assertEqual(result.date, from_class.date, "Date mapping must be equal")
+            self.assertTrue(isinstance(result.student, ToTestComplexChildClass), "Target types must be same")
+            self.assertEqual(result.student.full_name, from_class.student.full_name,
+                             "StudentName mapping must be equal")
+            self.assertEqual([k.full_name for k in result.knows], [k.full_name for k in from_class.knows],
+                             "Children mapping must be equal")
+        self.assertEqual(changed.date, "2015-01-01", "Changed type must be mapped")
+        self.assertIsNone(changed.student, "None must be mapped")
+        self.assertEqual(mapper.specialization_stats["deopts"], 1, "Failed type check must fall back")